@@ -1,4 +1,5 @@
 import os
+import argparse
 import asyncio
 import duckdb
 from processing.writers.bbox_writer import (
@@ -9,7 +10,7 @@ from processing.writers.landcover_writer import (
     create_landcover_table, update_landcover_from_tiff
 )
 from processing.writers.rcm_writer import (
-    create_rcm_ard_tables, update_rcm_ard_tables
+    create_rcm_ard_tables, update_rcm_ard_tables, refresh_rcm_ard_tables
 )
 from processing.writers.tile_writer import (
   create_rcm_ard_tiles_table, download_rcm_tiles
@@ -27,28 +28,150 @@ os.makedirs("./data/outputs", exist_ok=True)
 
 
 # -----------------------------
-# Main pipeline
+# Stages
 # -----------------------------
-async def main_async(resolution_m, tile_size):
-    con = duckdb.connect(DB_PATH)
-    
+async def stage_points(con, resolution_m, tile_size):
     create_bbox_table(con)
     await insert_points_async(con)
+
+
+async def stage_bboxes(con, resolution_m, tile_size):
     await update_bboxes_async(con, resolution_m, tile_size)
 
+
+async def stage_landcover(con, resolution_m, tile_size):
     create_landcover_table(con)
     await update_landcover_from_tiff(con)
+
+
+async def stage_census(con, resolution_m, tile_size):
     await update_census_data(con)
 
+
+async def stage_rcm_items(con, resolution_m, tile_size):
     await create_rcm_ard_tables(con)
     await update_rcm_ard_tables(con)
 
+
+async def stage_tiles(con, resolution_m, tile_size):
     await create_rcm_ard_tiles_table(con)
     await download_rcm_tiles(con)
 
+
+# stage name -> (runner, SQL counting rows with results)
+STAGES = {
+    "points": (stage_points, "SELECT COUNT(*) FROM canada_bboxes"),
+    "bboxes": (stage_bboxes, "SELECT COUNT(*) FROM canada_bboxes WHERE bbox IS NOT NULL"),
+    "landcover": (stage_landcover, "SELECT COUNT(*) FROM landcover_stats"),
+    "census": (stage_census, "SELECT COUNT(*) FROM canada_bboxes WHERE province_id IS NOT NULL"),
+    "rcm_items": (stage_rcm_items, "SELECT COUNT(*) FROM rcm_ard_queried"),
+    "tiles": (stage_tiles, "SELECT COUNT(*) FROM rcm_ard_tiles"),
+}
+
+
+# -----------------------------
+# Pipeline state
+# -----------------------------
+def create_pipeline_state_table(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_state (
+            stage TEXT PRIMARY KEY,
+            completed BOOLEAN,
+            rows_done BIGINT,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+
+
+def count_stage_rows(con, stage):
+    try:
+        return con.execute(STAGES[stage][1]).fetchone()[0]
+    except duckdb.CatalogException:
+        # stage table not created yet
+        return 0
+
+
+def mark_stage_started(con, stage):
+    con.execute("""
+        INSERT INTO pipeline_state VALUES (?, FALSE, ?, now(), NULL)
+        ON CONFLICT (stage) DO UPDATE SET
+            completed = FALSE, rows_done = excluded.rows_done,
+            started_at = excluded.started_at, finished_at = NULL
+    """, [stage, count_stage_rows(con, stage)])
+
+
+def mark_stage_finished(con, stage):
+    con.execute("""
+        UPDATE pipeline_state
+        SET completed = TRUE, rows_done = ?, finished_at = now()
+        WHERE stage = ?
+    """, [count_stage_rows(con, stage), stage])
+
+
+def completed_stages(con):
+    rows = con.execute("SELECT stage FROM pipeline_state WHERE completed").fetchall()
+    return {r[0] for r in rows}
+
+
+def select_stages(con, from_stage=None, only_stage=None):
+    """
+    Stages to run, in order. --only-stage and --from-stage force reruns;
+    otherwise every stage not yet marked complete runs.
+    """
+    names = list(STAGES)
+    if only_stage:
+        return [only_stage]
+    if from_stage:
+        return names[names.index(from_stage):]
+    done = completed_stages(con)
+    return [s for s in names if s not in done]
+
+
+# -----------------------------
+# Main pipeline
+# -----------------------------
+async def main_async(resolution_m, tile_size, from_stage=None, only_stage=None):
+    con = duckdb.connect(DB_PATH)
+    create_pipeline_state_table(con)
+
+    stages = select_stages(con, from_stage=from_stage, only_stage=only_stage)
+    if not stages:
+        print("✅ All stages already complete.")
+
+    for stage in stages:
+        print(f"▶️ Stage '{stage}'")
+        mark_stage_started(con, stage)
+        await STAGES[stage][0](con, resolution_m, tile_size)
+        mark_stage_finished(con, stage)
+
     con.close()
     print("🎉 Finished pipeline and stored all data in DuckDB.")
 
 
+async def refresh_async():
+    """Pick up new acquisitions for existing bboxes and crop only the new pairs."""
+    con = duckdb.connect(DB_PATH)
+    await create_rcm_ard_tables(con)
+    await refresh_rcm_ard_tables(con)
+    await create_rcm_ard_tiles_table(con)
+    await download_rcm_tiles(con, queued_only=True)
+    con.close()
+    print("🎉 Finished incremental refresh.")
+
+
 if __name__ == "__main__":
-    asyncio.run(main_async(resolution_m=RESOLUTION_M, tile_size=TILE_SIZE))
+    parser = argparse.ArgumentParser(description="Build the RCM-ARD DuckDB dataset.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--from-stage", choices=list(STAGES), help="rerun this stage and every later one")
+    group.add_argument("--only-stage", choices=list(STAGES), help="rerun only this stage")
+    group.add_argument("--refresh", action="store_true", help="fetch and crop only new acquisitions")
+    args = parser.parse_args()
+
+    if args.refresh:
+        asyncio.run(refresh_async())
+    else:
+        asyncio.run(main_async(
+            resolution_m=RESOLUTION_M, tile_size=TILE_SIZE,
+            from_stage=args.from_stage, only_stage=args.only_stage,
+        ))
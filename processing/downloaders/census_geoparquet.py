@@ -0,0 +1,12 @@
+from processing.utils.layer_utils import LAYERS, ingest_layer
+
+# Simplified variants (tolerance in degrees) for visualization
+SIMPLIFY_TOLERANCES = (0.001, 0.01)
+
+for name, layer in LAYERS.items():
+    print(f"Ingesting {layer['shapefile']}...")
+    paths = ingest_layer(layer["shapefile"], columns=layer["columns"], simplify_tolerances=SIMPLIFY_TOLERANCES)
+    for path in paths:
+        print(f"  → {path}")
+
+print("GeoParquet cache written to ./data/inputs/geoparquet")
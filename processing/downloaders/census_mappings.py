@@ -1,4 +1,4 @@
-import geopandas as gpd
+from processing.utils.layer_utils import read_layer
 import json
 
 # File paths
@@ -7,9 +7,9 @@ cd_shp = "./data/inputs/census_div"
 csd_shp = "./data/inputs/census_subdiv"
 
 # Load shapefiles
-gdf_prov = gpd.read_file(prov_shp)
-gdf_cd = gpd.read_file(cd_shp)
-gdf_csd = gpd.read_file(csd_shp)
+gdf_prov = read_layer(prov_shp)
+gdf_cd = read_layer(cd_shp)
+gdf_csd = read_layer(csd_shp)
 
 # 1) Province ID -> Name
 pr_mapping = {str(row["PRUID"]): row["PRNAME"] for _, row in gdf_prov.iterrows()}
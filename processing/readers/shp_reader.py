@@ -1,10 +1,10 @@
-import geopandas as gpd
+from processing.utils.layer_utils import read_layer
 
 # Path to your shapefile
 shapefile_path = "./data/inputs/prov_terr"
 
 # Load shapefile
-gdf = gpd.read_file(shapefile_path)
+gdf = read_layer(shapefile_path)
 
 # Print total number of subdivisions
 print(f"Total subdivisions: {len(gdf)}")
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 def get_bbox_from_point(lon: float, lat: float, resolution_m: int, tile_size: int):
@@ -30,3 +31,32 @@ def get_bbox_from_point(lon: float, lat: float, resolution_m: int, tile_size: in
         "bbox": (minlon, minlat, maxlon, maxlat),
         "deg_resolution": (deg_per_pixel_lon, deg_per_pixel_lat)
     }
+
+
+def get_bboxes_from_points(lons, lats, resolution_m: int, tile_size: int):
+    """
+    Vectorized get_bbox_from_point over arrays of lon/lat.
+
+    Returns:
+        dict with 'bbox' (N, 4) array of (minlon, minlat, maxlon, maxlat)
+        and 'deg_resolution' (N, 2) array of (deg_per_pixel_lon, deg_per_pixel_lat)
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+
+    # meters per degree
+    meters_per_deg_lat = 111_320.0
+    meters_per_deg_lon = 111_320.0 * np.cos(np.radians(lats))
+
+    # convert resolution to degrees
+    deg_per_pixel_lat = np.full_like(lats, resolution_m / meters_per_deg_lat)
+    deg_per_pixel_lon = resolution_m / meters_per_deg_lon
+
+    # half-extent = (tile_size-1)/2 pixels
+    half_lat = ((tile_size - 1) / 2) * deg_per_pixel_lat
+    half_lon = ((tile_size - 1) / 2) * deg_per_pixel_lon
+
+    return {
+        "bbox": np.column_stack([lons - half_lon, lats - half_lat, lons + half_lon, lats + half_lat]),
+        "deg_resolution": np.column_stack([deg_per_pixel_lon, deg_per_pixel_lat])
+    }
@@ -1,17 +1,76 @@
 import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+from processing.utils.layer_utils import read_layer
 
 
 class CanadaHierarchy:
     def __init__(self, pr_map="./data/inputs/PR_mapping.json",
                        cd_map="./data/inputs/CD_mapping.json",
                        csd_map="./data/inputs/CSD_mapping.json"):
-        # Load mappings once
-        with open(pr_map) as f:
-            self.prid_to_prname = json.load(f)
-        with open(cd_map) as f:
-            self.cdid_to_cdname = json.load(f)
-        with open(csd_map) as f:
-            self.csdid_to_csdname = json.load(f)
+        # Load mappings once into sorted integer ID arrays + name dictionaries
+        self.pr_ids, self.pr_names = self._load_mapping(pr_map)
+        self.cd_ids, self.cd_names = self._load_mapping(cd_map)
+        self.csd_ids, self.csd_names = self._load_mapping(csd_map)
+
+    @staticmethod
+    def _load_mapping(path):
+        with open(path) as f:
+            mapping = json.load(f)
+        ids = np.array([int(k) for k in mapping], dtype=np.int64)
+        order = np.argsort(ids)
+        names = pa.array(list(mapping.values()), type=pa.string()).take(pa.array(order))
+        return ids[order], names
+
+    @staticmethod
+    def _to_int_array(values, n):
+        """Coerce an ID column (ints, strings, None/NaN) to (int64 values, valid mask)."""
+        if values is None:
+            return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=bool)
+        numeric = pd.to_numeric(pd.Series(values).reset_index(drop=True), errors="coerce")
+        # copies: callers fill these in place, and pandas copy-on-write hands out read-only views
+        valid = numeric.notna().to_numpy(copy=True)
+        return numeric.fillna(0).to_numpy(dtype=np.int64, copy=True), valid
+
+    @staticmethod
+    def _lookup(ids, names, values, valid):
+        """Dictionary-encoded names for values found in the sorted ids array."""
+        idx = np.searchsorted(ids, values)
+        idx_clipped = np.minimum(idx, len(ids) - 1)
+        found = valid & (idx < len(ids)) & (ids[idx_clipped] == values)
+        indices = pa.array(idx_clipped.astype(np.int32), mask=~found)
+        return pa.DictionaryArray.from_arrays(indices, names)
+
+    def infer_hierarchy_batch(self, csduids=None, cduids=None, pruids=None):
+        """
+        Vectorized infer_hierarchy over ID columns of equal length.
+
+        The most specific ID present in each row wins: a CSDUID determines its
+        CD and PR by integer prefix (PR(2) + CD(2) + CSD(3) digits), a CDUID
+        determines its PR. Missing values are null.
+        Returns a pyarrow Table with columns PRUID, PRNAME, CDUID, CDNAME, CSDUID, CSDNAME;
+        names are dictionary-encoded.
+        """
+        n = next(len(v) for v in (csduids, cduids, pruids) if v is not None)
+        csd, csd_valid = self._to_int_array(csduids, n)
+        cd_in, cd_in_valid = self._to_int_array(cduids, n)
+        pr_in, pr_in_valid = self._to_int_array(pruids, n)
+
+        cd = np.where(csd_valid, csd // 1000, cd_in)
+        cd_valid = csd_valid | cd_in_valid
+        pr = np.where(csd_valid, csd // 100_000, np.where(cd_in_valid, cd_in // 100, pr_in))
+        pr_valid = cd_valid | pr_in_valid
+
+        return pa.table({
+            "PRUID": pa.array(pr, mask=~pr_valid),
+            "PRNAME": self._lookup(self.pr_ids, self.pr_names, pr, pr_valid),
+            "CDUID": pa.array(cd, mask=~cd_valid),
+            "CDNAME": self._lookup(self.cd_ids, self.cd_names, cd, cd_valid),
+            "CSDUID": pa.array(csd, mask=~csd_valid),
+            "CSDNAME": self._lookup(self.csd_ids, self.csd_names, csd, csd_valid),
+        })
 
     def infer_hierarchy(self, pt):
         """
@@ -20,38 +79,104 @@ class CanadaHierarchy:
         Returns a dictionary with keys: PRUID, PRNAME, CDUID, CDNAME, CSDUID, CSDNAME.
         Missing values are set to None.
         """
-        csd_id = pt.get("CSDUID")
-        cd_id = pt.get("CDUID")
-        pr_id = pt.get("PRUID")
-
-        hierarchy = {
-            "PRUID": None,
-            "PRNAME": None,
-            "CDUID": None,
-            "CDNAME": None,
-            "CSDUID": None,
-            "CSDNAME": None
-        }
+        table = self.infer_hierarchy_batch(
+            [pt.get("CSDUID")], [pt.get("CDUID")], [pt.get("PRUID")]
+        )
+        return {k: v[0] for k, v in table.to_pydict().items()}
+
+
+class CensusResolver:
+    """
+    Hierarchical point-in-polygon resolver: province -> census division -> census subdivision.
+
+    Layers are loaded once. Each level keeps one STRtree per parent region, so a
+    point is only tested against the children of its already-resolved parent.
+    Call resolve() repeatedly with new point batches; nothing is reloaded.
+    """
+
+    def __init__(self, pr_path="./data/inputs/prov_terr",
+                       cd_path="./data/inputs/census_div",
+                       csd_path="./data/inputs/census_subdiv"):
+        pr_gdf = read_layer(pr_path, columns=["PRUID"])
+        cd_gdf = read_layer(cd_path, columns=["CDUID"])
+        csd_gdf = read_layer(csd_path, columns=["CSDUID"])
+
+        pr_ids = pr_gdf["PRUID"].astype("int64").to_numpy()
+        cd_ids = cd_gdf["CDUID"].astype("int64").to_numpy()
+        csd_ids = csd_gdf["CSDUID"].astype("int64").to_numpy()
 
-        if csd_id is not None:
-            hierarchy["CSDUID"] = int(csd_id)
-            hierarchy["CSDNAME"] = self.csdid_to_csdname.get(str(csd_id))
-            cd_id = int(str(csd_id)[:4])
-            hierarchy["CDUID"] = cd_id
-            hierarchy["CDNAME"] = self.cdid_to_cdname.get(str(cd_id))
-            pr_id = int(str(csd_id)[:2])
-            hierarchy["PRUID"] = pr_id
-            hierarchy["PRNAME"] = self.prid_to_prname.get(str(pr_id))
-
-        elif cd_id is not None:
-            hierarchy["CDUID"] = int(cd_id)
-            hierarchy["CDNAME"] = self.cdid_to_cdname.get(str(cd_id))
-            pr_id = int(str(cd_id)[:2])
-            hierarchy["PRUID"] = pr_id
-            hierarchy["PRNAME"] = self.prid_to_prname.get(str(pr_id))
-
-        elif pr_id is not None:
-            hierarchy["PRUID"] = int(pr_id)
-            hierarchy["PRNAME"] = self.prid_to_prname.get(str(pr_id))
-
-        return hierarchy
+        # Root level has a single tree; child levels are keyed by parent ID (integer prefix)
+        self.pr_level = self._build_trees(pr_gdf.geometry.values, pr_ids, np.zeros_like(pr_ids))
+        self.cd_level = self._build_trees(cd_gdf.geometry.values, cd_ids, cd_ids // 100)
+        self.csd_level = self._build_trees(csd_gdf.geometry.values, csd_ids, csd_ids // 1000)
+
+    @staticmethod
+    def _build_trees(geoms, ids, parent_ids):
+        geoms = np.asarray(geoms)
+        shapely.prepare(geoms)
+        level = {}
+        for parent in np.unique(parent_ids):
+            sel = parent_ids == parent
+            level[int(parent)] = (shapely.STRtree(geoms[sel]), ids[sel])
+        return level
+
+    @staticmethod
+    def _resolve_level(level, points, parents, todo):
+        """
+        Resolve IDs at one level for points[todo], querying only the tree of each point's parent.
+
+        Returns:
+            (ids, found) arrays over todo
+        """
+        ids = np.zeros(len(todo), dtype=np.int64)
+        found = np.zeros(len(todo), dtype=bool)
+        todo_parents = parents[todo]
+        for parent in np.unique(todo_parents):
+            if int(parent) not in level:
+                continue
+            tree, tree_ids = level[int(parent)]
+            sel = np.flatnonzero(todo_parents == parent)
+            pt_idx, geom_idx = tree.query(points[todo[sel]], predicate="within")
+            # boundary points can match twice; keep the first hit
+            pt_idx, first = np.unique(pt_idx, return_index=True)
+            ids[sel[pt_idx]] = tree_ids[geom_idx[first]]
+            found[sel[pt_idx]] = True
+        return ids, found
+
+    def resolve(self, lons, lats, pruids=None, cduids=None):
+        """
+        Resolve PRUID, CDUID and CSDUID for a batch of points.
+
+        Known PRUIDs/CDUIDs (nullable) skip the levels above them.
+        Returns:
+            dict of PRUID/CDUID/CSDUID -> (int64 values, valid mask)
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        n = len(lons)
+        points = shapely.points(lons, lats)
+
+        pr, pr_valid = CanadaHierarchy._to_int_array(pruids, n)
+        cd, cd_valid = CanadaHierarchy._to_int_array(cduids, n)
+        pr = np.where(cd_valid, cd // 100, pr)
+        pr_valid = pr_valid | cd_valid
+        csd = np.zeros(n, dtype=np.int64)
+        csd_valid = np.zeros(n, dtype=bool)
+
+        todo = np.flatnonzero(~pr_valid)
+        ids, found = self._resolve_level(self.pr_level, points, np.zeros(n, dtype=np.int64), todo)
+        pr[todo], pr_valid[todo] = ids, found
+
+        todo = np.flatnonzero(pr_valid & ~cd_valid)
+        ids, found = self._resolve_level(self.cd_level, points, pr, todo)
+        cd[todo], cd_valid[todo] = ids, found
+
+        todo = np.flatnonzero(cd_valid)
+        ids, found = self._resolve_level(self.csd_level, points, cd, todo)
+        csd[todo], csd_valid[todo] = ids, found
+
+        return {
+            "PRUID": (pr, pr_valid),
+            "CDUID": (cd, cd_valid),
+            "CSDUID": (csd, csd_valid),
+        }
@@ -0,0 +1,205 @@
+import io
+import os
+import hashlib
+import requests
+
+
+CACHE_DIR = "./data/inputs/cog_cache"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+BLOCK_BYTES = 512 * 1024  # HTTP range granularity and cache entry size
+EVICT_EVERY = 64  # block writes between cache size checks
+REQUEST_TIMEOUT = 60
+# S3 answers 403 rather than 404 for missing keys when listing is not allowed
+MISSING_STATUSES = {403, 404, 410}
+
+
+class BlockCache:
+    """
+    On-disk cache of fixed-size byte blocks with LRU eviction by mtime.
+
+    Every process opens its own BlockCache on the same directory; entries are
+    written atomically, so concurrent readers never see partial blocks and
+    concurrent evictions only ever delete whole files.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes or CACHE_MAX_BYTES
+        self._writes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, url, idx):
+        key = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}_{idx}.blk")
+
+    def get(self, url, idx):
+        path = self._path(url, idx)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, idx, data):
+        path = self._path(url, idx)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used blocks until the cache is under 90% of max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".blk"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        target = 0.9 * self.max_bytes
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= target:
+                break
+
+
+class RangeFile(io.RawIOBase):
+    """Read-only, seekable file over HTTP range requests, backed by a BlockCache."""
+
+    def __init__(self, url, session, cache, block_bytes=BLOCK_BYTES):
+        self.url = url
+        self.session = session
+        self.cache = cache
+        self.block_bytes = block_bytes
+        self.pos = 0
+        self._size = None
+
+    @property
+    def size(self):
+        if self._size is None:
+            resp = self.session.head(self.url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            if resp.status_code in MISSING_STATUSES:
+                # GDAL probes for .aux.xml/.msk sidecars and expects missing files to be reported as such
+                raise FileNotFoundError(self.url)
+            resp.raise_for_status()
+            self._size = int(resp.headers["Content-Length"])
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.pos
+
+    def _fetch(self, first, last):
+        """Fetch blocks first..last (inclusive) in one range request and cache them."""
+        start = first * self.block_bytes
+        end = min((last + 1) * self.block_bytes, self.size) - 1
+        resp = self.session.get(
+            self.url, headers={"Range": f"bytes={start}-{end}"}, timeout=REQUEST_TIMEOUT
+        )
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise IOError(f"Server ignored range request for {self.url}")
+        data = resp.content
+
+        blocks = {}
+        for idx in range(first, last + 1):
+            off = (idx - first) * self.block_bytes
+            blocks[idx] = data[off:off + self.block_bytes]
+            self.cache.put(self.url, idx, blocks[idx])
+        return blocks
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.pos
+        n = max(0, min(n, self.size - self.pos))
+        if n == 0:
+            return b""
+
+        first = self.pos // self.block_bytes
+        last = (self.pos + n - 1) // self.block_bytes
+
+        blocks = {}
+        missing = []
+        for idx in range(first, last + 1):
+            data = self.cache.get(self.url, idx)
+            if data is None:
+                missing.append(idx)
+            else:
+                blocks[idx] = data
+
+        # one request per contiguous run of missing blocks
+        run_start = None
+        for i, idx in enumerate(missing):
+            if run_start is None:
+                run_start = idx
+            if i + 1 == len(missing) or missing[i + 1] != idx + 1:
+                blocks.update(self._fetch(run_start, idx))
+                run_start = None
+
+        buf = b"".join(blocks[idx] for idx in range(first, last + 1))
+        off = self.pos - first * self.block_bytes
+        out = buf[off:off + n]
+        self.pos += len(out)
+        return out
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class CachedRangeOpener:
+    """
+    rasterio `opener` that serves a remote COG through RangeFile, so GDAL only
+    fetches the byte ranges (tiles, IFDs) it touches and reuses cached blocks.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, block_bytes=BLOCK_BYTES):
+        self.cache = BlockCache(cache_dir, max_bytes)
+        self.block_bytes = block_bytes
+        self.session = requests.Session()
+
+    def __call__(self, path, mode="rb"):
+        # rasterio validates openers with a dummy path, and local paths are not ours to serve
+        if not is_remote(path):
+            raise FileNotFoundError(path)
+        f = RangeFile(path, self.session, self.cache, self.block_bytes)
+        f.size  # fail at open time for missing files
+        return f
+
+
+def is_remote(path):
+    return str(path).startswith(("http://", "https://"))
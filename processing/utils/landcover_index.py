@@ -0,0 +1,161 @@
+import os
+import json
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.windows import Window
+from tqdm import tqdm
+from processing.utils.landcover_utils import bbox_windows, compute_entropy
+
+
+NUM_CLASSES = 19
+INDEX_DIR = "./data/inputs/landcover_index"
+BLOCK_SIZE = 16  # summed-area table cell, in raster pixels
+
+
+def _level_path(index_dir, block_size):
+    return os.path.join(index_dir, f"sat_{block_size}.npy")
+
+
+def _class_counts(pixels):
+    """Histogram of one pixel array; values above NUM_CLASSES are dropped."""
+    counts = np.bincount(np.minimum(pixels.ravel(), NUM_CLASSES + 1), minlength=NUM_CLASSES + 2)
+    return counts[:NUM_CLASSES + 1].astype(np.int64)
+
+
+def build_landcover_index(tiff_path, index_dir=INDEX_DIR, block_size=BLOCK_SIZE):
+    """
+    Build a per-class summed-area table over block counts of a landcover raster.
+
+    S[r, c, k] = number of class-k pixels (k=0 is nodata) above and to the left
+    of block (r, c), as a memory-mappable .npy array of shape
+    (rows + 1, cols + 1, NUM_CLASSES + 1). Sums are uint32 and wrap; differences
+    of four corners are exact as long as a query window holds < 2**32 pixels.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    n_bins = NUM_CLASSES + 2  # spare bin for values above NUM_CLASSES
+
+    with rasterio.open(tiff_path) as src:
+        n_rows = -(-src.height // block_size)
+        n_cols = -(-src.width // block_size)
+        # read strips aligned to the file's internal blocks so each is decoded once
+        strip_rows = int(np.lcm(src.block_shapes[0][0], block_size))
+
+        sat = np.lib.format.open_memmap(
+            _level_path(index_dir, block_size), mode="w+",
+            dtype=np.uint32, shape=(n_rows + 1, n_cols + 1, NUM_CLASSES + 1),
+        )
+        block_ids = np.arange(n_cols * block_size) // block_size
+        row = 0
+        for strip_off in tqdm(range(0, src.height, strip_rows), desc="Building landcover index"):
+            strip_h = min(strip_rows, src.height - strip_off)
+            strip = src.read(1, window=Window(0, strip_off, src.width, strip_h))
+
+            # pad to whole blocks with the spare value so padding is never counted
+            pad = np.full(
+                (-(-strip_h // block_size) * block_size, n_cols * block_size), NUM_CLASSES + 1, dtype=np.uint8
+            )
+            pad[:strip_h, :src.width] = np.minimum(strip, NUM_CLASSES + 1)
+
+            for sub in range(0, pad.shape[0], block_size):
+                block_row = pad[sub:sub + block_size].astype(np.int64)
+                counts = np.bincount(
+                    (block_row + block_ids * n_bins).ravel(), minlength=n_cols * n_bins
+                ).reshape(n_cols, n_bins)[:, :NUM_CLASSES + 1].astype(np.uint32)
+
+                sat[row + 1, 1:] = sat[row, 1:] + np.cumsum(counts, axis=0, dtype=np.uint32)
+                row += 1
+
+        sat.flush()
+
+        meta = {
+            "tiff_path": os.path.abspath(tiff_path),
+            "crs": src.crs.to_wkt(),
+            "transform": list(src.transform)[:6],
+            "width": src.width,
+            "height": src.height,
+            "block_size": block_size,
+        }
+
+    with open(os.path.join(index_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ Landcover index written to {index_dir}")
+
+
+def _edge_strips(r0, c0, r1, c1, block):
+    """
+    Split the pixel window [r0, r1) x [c0, c1) into its inner block-aligned
+    rectangle (in block units) and the pixel strips around it.
+
+    Windows too small to contain a whole block come back as one strip.
+    """
+    br0, bc0 = -(-r0 // block), -(-c0 // block)
+    br1, bc1 = r1 // block, c1 // block
+    if br0 >= br1 or bc0 >= bc1:
+        return (0, 0, 0, 0), [(r0, c0, r1, c1)]
+
+    ir0, ic0, ir1, ic1 = br0 * block, bc0 * block, br1 * block, bc1 * block
+    strips = [
+        (r0, c0, ir0, c1),    # top, full width
+        (ir1, c0, r1, c1),    # bottom, full width
+        (ir0, c0, ir1, ic0),  # left, inner rows
+        (ir0, ic1, ir1, c1),  # right, inner rows
+    ]
+    return (br0, bc0, br1, bc1), [s for s in strips if s[0] < s[2] and s[1] < s[3]]
+
+
+class LandcoverIndex:
+    """
+    Exact landcover histograms for any bbox from a summed-area table.
+
+    The block-aligned interior of each bbox window comes from a four-corner
+    lookup; the partial-block strips along its edges are read from the source
+    raster, so a query reads O(perimeter) pixels instead of O(area).
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, tiff_path=None):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.crs = rasterio.crs.CRS.from_wkt(self.meta["crs"])
+        self.transform = Affine(*self.meta["transform"])
+        self.block_size = self.meta["block_size"]
+        self.tiff_path = tiff_path or self.meta["tiff_path"]
+        self.sat = np.load(_level_path(index_dir, self.block_size), mmap_mode="r")
+
+    def query(self, bboxes):
+        """
+        Class histograms for lon/lat bboxes, exact to the pixel.
+
+        Returns:
+            dict with 'counts' (N, NUM_CLASSES) class counts, 'nodata' (N,),
+            'total_count' (N,) with -1 for bboxes off the raster and 'entropy' (N,)
+        """
+        windows, overlap = bbox_windows(
+            bboxes, self.crs, self.transform, self.meta["width"], self.meta["height"]
+        )
+        counts_bin = np.zeros((len(windows), NUM_CLASSES + 1), dtype=np.int64)
+        sat = self.sat
+
+        with rasterio.open(self.tiff_path) as src:
+            for i in np.flatnonzero(overlap):
+                row_off, col_off, height, width = windows[i]
+                (br0, bc0, br1, bc1), strips = _edge_strips(
+                    row_off, col_off, row_off + height, col_off + width, self.block_size
+                )
+                # four-corner lookup; uint32 wraparound cancels out in the difference
+                counts_bin[i] = (sat[br1, bc1] - sat[br0, bc1] - sat[br1, bc0] + sat[br0, bc0]).astype(np.int64)
+                for r0, c0, r1, c1 in strips:
+                    counts_bin[i] += _class_counts(src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0)))
+
+        counts = counts_bin[:, 1:]
+        total_count = np.where(overlap, counts.sum(axis=1), -1)
+        return {
+            "counts": counts,
+            "nodata": counts_bin[:, 0],
+            "total_count": total_count,
+            "entropy": compute_entropy(counts),
+        }
+
+
+if __name__ == "__main__":
+    build_landcover_index("./data/inputs/landcover-2020-classification.tif")
@@ -1,11 +1,67 @@
-from math import log2
 import numpy as np
+from pyproj import Transformer
+
+
+BBOX_CRS = 'EPSG:4326'
 
 
 def compute_entropy(counts):
-    """Compute Shannon entropy from a histogram (ignoring zeros)."""
-    total = counts.sum()
-    if total == 0:
-        return 0.0
-    probs = counts / total
-    return -np.sum([p * log2(p) for p in probs if p > 0])
+    """
+    Compute Shannon entropy from a histogram (ignoring zeros).
+
+    Accepts a single histogram or an (N, C) matrix of histograms, in which
+    case an (N,) array of entropies is returned.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probs = np.where(total > 0, counts / total, 0.0)
+        terms = np.where(probs > 0, probs * np.log2(probs), 0.0)
+    entropy = -terms.sum(axis=-1)
+    return float(entropy) if entropy.ndim == 0 else entropy
+
+
+def morton_code(x, y, bits=16):
+    """Interleave the bits of non-negative integer arrays x and y (Z-order curve)."""
+    x = np.asarray(x, dtype=np.uint64)
+    y = np.asarray(y, dtype=np.uint64)
+    code = np.zeros(np.broadcast(x, y).shape, dtype=np.uint64)
+    for b in range(bits):
+        code |= ((x >> np.uint64(b)) & np.uint64(1)) << np.uint64(2 * b)
+        code |= ((y >> np.uint64(b)) & np.uint64(1)) << np.uint64(2 * b + 1)
+    return code
+
+
+def bbox_windows(bboxes, crs, transform, width, height):
+    """
+    Vectorized conversion of lon/lat bboxes to integer pixel windows on a
+    north-up raster grid.
+
+    Returns:
+        (windows, overlap): (N, 4) int64 array of (row_off, col_off, height, width)
+        clipped to the raster, and a mask of bboxes that overlap it at all
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    transformer = Transformer.from_crs(BBOX_CRS, crs, always_xy=True)
+
+    # Transform bbox coordinates into raster CRS
+    x0, y0 = transformer.transform(bboxes[:, 0], bboxes[:, 1])
+    x1, y1 = transformer.transform(bboxes[:, 2], bboxes[:, 3])
+    minx, maxx = np.minimum(x0, x1), np.maximum(x0, x1)
+    miny, maxy = np.minimum(y0, y1), np.maximum(y0, y1)
+
+    # Pixel coordinates (no resampling)
+    t = transform
+    col_min, col_max = (minx - t.c) / t.a, (maxx - t.c) / t.a
+    row_min, row_max = (maxy - t.f) / t.e, (miny - t.f) / t.e
+
+    # Check overlap with raster extent
+    overlap = (col_max > 0) & (col_min < width) & (row_max > 0) & (row_min < height)
+
+    col_start = np.clip(np.floor(col_min), 0, width).astype(np.int64)
+    col_stop = np.clip(np.ceil(col_max), 0, width).astype(np.int64)
+    row_start = np.clip(np.floor(row_min), 0, height).astype(np.int64)
+    row_stop = np.clip(np.ceil(row_max), 0, height).astype(np.int64)
+
+    windows = np.column_stack([row_start, col_start, row_stop - row_start, col_stop - col_start])
+    return windows, overlap
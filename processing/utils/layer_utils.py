@@ -0,0 +1,92 @@
+import os
+import geopandas as gpd
+
+
+GEOPARQUET_DIR = "./data/inputs/geoparquet"
+LAYER_CRS = "EPSG:4326"  # every cached layer is written in this CRS
+BOUNDS_COLUMNS = ["minx", "miny", "maxx", "maxy"]  # per-feature bounds added by ingest_layer
+
+# shapefile folder -> attribute columns kept in the cache
+LAYERS = {
+    "prov_terr": {"shapefile": "./data/inputs/prov_terr", "columns": ["PRUID", "PRNAME"]},
+    "census_div": {"shapefile": "./data/inputs/census_div", "columns": ["CDUID", "CDNAME", "PRUID"]},
+    "census_subdiv": {"shapefile": "./data/inputs/census_subdiv", "columns": ["CSDUID", "CSDNAME", "CDUID", "PRUID"]},
+}
+
+
+def shapefile_mtime(shapefile):
+    """Latest modification time of a shapefile (file or directory of sidecar files)."""
+    if os.path.isdir(shapefile):
+        return max(
+            (os.path.getmtime(os.path.join(shapefile, f)) for f in os.listdir(shapefile)),
+            default=os.path.getmtime(shapefile),
+        )
+    return os.path.getmtime(shapefile)
+
+
+def _layer_name(shapefile):
+    return os.path.basename(os.path.normpath(shapefile))
+
+
+def layer_cache_path(shapefile, simplify=None, cache_dir=GEOPARQUET_DIR):
+    """GeoParquet path for a shapefile, optionally for a simplified variant."""
+    name = _layer_name(shapefile)
+    if simplify is not None:
+        name = f"{name}_simplified_{simplify:g}"
+    return os.path.join(cache_dir, f"{name}.parquet")
+
+
+def ingest_layer(shapefile, columns=None, simplify_tolerances=(), cache_dir=GEOPARQUET_DIR):
+    """
+    Read a shapefile once, reproject to EPSG:4326 and write it to GeoParquet
+    with bounds columns (minx, miny, maxx, maxy). Simplified variants are written
+    alongside for each tolerance (in degrees).
+
+    Returns:
+        list of written paths
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    gdf = gpd.read_file(shapefile)
+    if gdf.crs is None or gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    if columns is not None:
+        gdf = gdf[[c for c in columns if c in gdf.columns] + ["geometry"]]
+
+    written = []
+    for tol in (None, *simplify_tolerances):
+        out = gdf if tol is None else gdf.set_geometry(gdf.geometry.simplify(tol, preserve_topology=True))
+        out = out.join(out.geometry.bounds)
+        path = layer_cache_path(shapefile, simplify=tol, cache_dir=cache_dir)
+        out.to_parquet(path, index=False)
+        written.append(path)
+    return written
+
+
+def read_layer(shapefile, simplify=None, columns=None, cache_dir=GEOPARQUET_DIR):
+    """
+    Load a layer in EPSG:4326, from its GeoParquet cache when it is present and
+    newer than the shapefile, otherwise from the shapefile itself.
+    """
+    path = layer_cache_path(shapefile, simplify=simplify, cache_dir=cache_dir)
+    if os.path.exists(path) and (
+        not os.path.exists(shapefile) or os.path.getmtime(path) >= shapefile_mtime(shapefile)
+    ):
+        if columns is not None:
+            columns = [*columns, "geometry"]
+        gdf = gpd.read_parquet(path, columns=columns)
+        if gdf.crs is None:
+            # caches written without GeoParquet CRS metadata are still in LAYER_CRS
+            gdf = gdf.set_crs(LAYER_CRS)
+        return gdf
+
+    if simplify is not None:
+        raise FileNotFoundError(f"No simplified cache at {path}; run the GeoParquet ingestion first")
+
+    print(f"⚠️ No GeoParquet cache for {shapefile}, reading shapefile")
+    gdf = gpd.read_file(shapefile)
+    if gdf.crs is None or gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    if columns is not None:
+        gdf = gdf[[*columns, "geometry"]]
+    return gdf
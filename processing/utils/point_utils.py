@@ -1,13 +1,35 @@
+import os
 import random
-import geopandas as gpd
-from shapely.geometry import Point
+import numpy as np
+import shapely
 import asyncio
+from tqdm import tqdm
 from tqdm.asyncio import tqdm_asyncio
-from concurrent.futures import ThreadPoolExecutor
+from pyproj import Transformer
+from concurrent.futures import ProcessPoolExecutor
+from processing.utils.layer_utils import read_layer, shapefile_mtime
 
 
 CANADA_BBOX = [-141.002, 41.676, -52.63, 83.136]  # lon/lat bounds
 
+# Batch rejection sampling
+MAX_SAMPLE_ATTEMPTS = 1000  # candidates per requested point before giving up
+MIN_SAMPLE_BATCH = 64
+MIN_FILL_RATIO = 1e-3  # floor on polygon area / bbox area when sizing batches
+BATCH_OVERSAMPLE = 1.5
+CHUNKS_PER_WORKER = 4
+
+# Triangulation sampling
+TRIANGLE_CACHE_DIR = "./data/inputs/triangles"
+
+# Land-masked random sampling
+LAND_MASK_SHAPEFILE = "./data/inputs/prov_terr"
+LAND_FILL_RATIO = 0.5  # rough share of CANADA_BBOX that is Canadian land, used to size batches
+LAND_MASK = None  # prepared mask, set per worker process
+
+# Minimum-separation filtering
+SEPARATION_CRS = "EPSG:3347"  # Statistics Canada Lambert, metres
+
 
 def get_random_lon_lat_within_canada():
     """
@@ -18,79 +40,428 @@ def get_random_lon_lat_within_canada():
     return lon, lat
 
 
-async def sample_points_per_geometry(shapefile, id_column, n_points_per_geom=1, seed=None, max_concurrent=100):
+def _sample_geometry(geom, n_points, seed):
+    """
+    Batch rejection sampler for a single geometry.
+
+    Candidates are drawn as NumPy arrays sized from the polygon's fill ratio
+    of its bbox and tested with vectorized `shapely.contains_xy` against the
+    prepared geometry. At most MAX_SAMPLE_ATTEMPTS candidates are drawn per
+    requested point.
+
+    Returns:
+        (lons, lats) arrays with up to n_points entries
+    """
+    rng = np.random.default_rng(seed)
+    shapely.prepare(geom)
+
+    minx, miny, maxx, maxy = geom.bounds
+    bbox_area = (maxx - minx) * (maxy - miny)
+    fill = geom.area / bbox_area if bbox_area > 0 else 0.0
+
+    budget = MAX_SAMPLE_ATTEMPTS * n_points
+    lons, lats = [], []
+    n_accepted = 0
+
+    while n_accepted < n_points and budget > 0:
+        remaining = n_points - n_accepted
+        # oversample by the expected rejection rate so most geometries finish in one batch
+        batch = int(remaining / max(fill, MIN_FILL_RATIO) * BATCH_OVERSAMPLE)
+        batch = min(budget, max(MIN_SAMPLE_BATCH, batch))
+        budget -= batch
+
+        cand_lon = rng.uniform(minx, maxx, batch)
+        cand_lat = rng.uniform(miny, maxy, batch)
+        inside = shapely.contains_xy(geom, cand_lon, cand_lat)
+
+        cand_lon = cand_lon[inside][:remaining]
+        cand_lat = cand_lat[inside][:remaining]
+        lons.append(cand_lon)
+        lats.append(cand_lat)
+        n_accepted += len(cand_lon)
+
+    if not lons:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(lons), np.concatenate(lats)
+
+
+def _sample_geometry_chunk(chunk):
+    """Worker function: sample every (row_id, geom, n_points, seed) task in a chunk."""
+    results = []
+    for row_id, geom, n_points, seed in chunk:
+        lons, lats = _sample_geometry(geom, n_points, seed)
+        results.append((row_id, n_points, lons, lats))
+    return results
+
+
+def _triangulate_shapefile(shapefile, id_column):
+    """
+    Triangulate every geometry in a shapefile once.
+
+    Geometries that cannot be triangulated (GEOS errors, no triangles, or
+    shapely < 2.1 without constrained_delaunay_triangles) are listed in
+    'fallback_ids' so callers can rejection-sample them instead.
+
+    Returns:
+        dict with 'ids' (G,), 'offsets' (G+1,) into the triangle arrays,
+        'triangles' (T, 3, 2) vertex coordinates, 'cum_area' (T,) running
+        triangle area and 'fallback_ids' (F,)
     """
-    Async version: sample random lon/lat points from each geometry concurrently.
+    gdf = read_layer(shapefile)
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna() & gdf[id_column].notna()]
+
+    triangulate = getattr(shapely, "constrained_delaunay_triangles", None)
+    if triangulate is None:
+        print("⚠️ shapely < 2.1 has no constrained_delaunay_triangles; rejection-sampling every geometry")
+
+    ids = []
+    fallback_ids = []
+    offsets = [0]
+    triangles = []
+    for row_id, geom in tqdm(zip(gdf[id_column], gdf.geometry), total=len(gdf), desc="Triangulating geometries"):
+        try:
+            tris = shapely.get_parts(triangulate(geom)) if triangulate is not None else []
+        except shapely.errors.GEOSException:
+            tris = []
+        if len(tris) == 0:
+            fallback_ids.append(str(row_id))
+            continue
+        # exterior ring of each triangle is (a, b, c, a)
+        coords = shapely.get_coordinates(shapely.get_exterior_ring(tris)).reshape(-1, 4, 2)[:, :3]
+        triangles.append(coords)
+        ids.append(str(row_id))
+        offsets.append(offsets[-1] + len(coords))
+
+    triangles = np.concatenate(triangles) if triangles else np.empty((0, 3, 2))
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    areas = 0.5 * np.abs(
+        (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+    )
+
+    return {
+        "ids": np.array(ids, dtype=str),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "triangles": triangles,
+        "cum_area": np.cumsum(areas),
+        "fallback_ids": np.array(fallback_ids, dtype=str),
+    }
+
+
+def load_triangulation(shapefile, id_column, cache_dir=None):
+    """
+    Load the cached triangulation for a shapefile (under TRIANGLE_CACHE_DIR by
+    default), rebuilding it if missing or stale.
+    """
+    cache_dir = cache_dir or TRIANGLE_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.basename(os.path.normpath(shapefile))
+    cache_path = os.path.join(cache_dir, f"{name}_{id_column}.npz")
+
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= shapefile_mtime(shapefile):
+        with np.load(cache_path) as cached:
+            # caches written before per-geometry fallback have no 'fallback_ids'
+            if "fallback_ids" in cached.files:
+                return {k: cached[k] for k in cached.files}
+
+    tri = _triangulate_shapefile(shapefile, id_column)
+    np.savez(cache_path, **tri)
+    print(f"💾 Cached {len(tri['triangles'])} triangles for {len(tri['ids'])} geometries at {cache_path}")
+    return tri
+
+
+def sample_points_from_triangulation(tri, n_points_per_geom, seed=None):
+    """
+    Exact uniform sampling inside each geometry with no rejection.
+
+    A triangle is picked with probability proportional to its area by
+    binary search over the cumulative-area table, then a point is drawn
+    uniformly inside it from reflected barycentric coordinates.
+
+    Returns:
+        (geometry index, lons, lats) arrays of length G * n_points_per_geom
+    """
+    rng = np.random.default_rng(seed)
+    offsets = tri["offsets"]
+    cum_area = tri["cum_area"]
+    triangles = tri["triangles"]
+
+    geom_idx = np.repeat(np.arange(len(offsets) - 1), n_points_per_geom)
+    start, end = offsets[geom_idx], offsets[geom_idx + 1]
+    area_before = np.where(start > 0, cum_area[np.maximum(start - 1, 0)], 0.0)
+    geom_area = cum_area[end - 1] - area_before
+
+    # area-weighted triangle choice, O(log T) per point
+    u = area_before + rng.random(len(geom_idx)) * geom_area
+    tri_idx = np.clip(np.searchsorted(cum_area, u, side="right"), start, end - 1)
+
+    r1 = rng.random(len(geom_idx))
+    r2 = rng.random(len(geom_idx))
+    flip = r1 + r2 > 1
+    r1[flip], r2[flip] = 1 - r1[flip], 1 - r2[flip]
+
+    a, b, c = triangles[tri_idx, 0], triangles[tri_idx, 1], triangles[tri_idx, 2]
+    pts = a + r1[:, None] * (b - a) + r2[:, None] * (c - a)
+    return geom_idx, pts[:, 0], pts[:, 1]
+
+
+def _sample_fallback_geometries(shapefile, id_column, fallback_ids, n_points_per_geom, seed=None):
+    """Rejection-sample the geometries a triangulation could not cover."""
+    if not fallback_ids:
+        return []
+    gdf = read_layer(shapefile)
+    gdf = gdf[gdf[id_column].astype(str).isin(fallback_ids) & ~gdf.geometry.is_empty & gdf.geometry.notna()]
+    print(f"⚠️ Rejection-sampling {len(gdf)} geometries that could not be triangulated")
+
+    # spawned separately from the triangulation stream, one child per geometry
+    seeds = np.random.SeedSequence(seed).spawn(len(gdf))
+    results = []
+    for row_id, geom, s in zip(gdf[id_column], gdf.geometry, seeds):
+        lons, lats = _sample_geometry(geom, n_points_per_geom, s)
+        if len(lons) < n_points_per_geom:
+            print(f"⚠️ Warning: Could only sample {len(lons)}/{n_points_per_geom} points inside geometry {row_id}")
+        results.extend(
+            {"lon": float(lon), "lat": float(lat), id_column: str(row_id)}
+            for lon, lat in zip(lons, lats)
+        )
+    return results
+
+
+async def sample_points_per_geometry(shapefile, id_column, n_points_per_geom=1, seed=None, n_workers=None,
+                                     method="rejection", ids=None):
+    """
+    Sample random lon/lat points from each geometry.
+
+    method="rejection" draws bbox candidates across a process pool;
+    method="triangulation" samples exactly from a cached triangulation
+    (see load_triangulation), which never under-samples thin or concave
+    geometries; it needs shapely >= 2.1, and any geometry that cannot be
+    triangulated is rejection-sampled instead.
 
     Parameters:
         shapefile: path to geometry shapefile
         id_column: column name to get ID from
         n_points_per_geom: int, number of points to sample per geometry
         seed: int, optional random seed for reproducibility
-        max_concurrent: limit of concurrent geometry sampling tasks
+        n_workers: number of worker processes (defaults to CPU count)
+        method: "rejection" or "triangulation"
+        ids: optional collection of IDs (as strings) to restrict sampling to
 
     Returns:
         List of dicts with keys: lon, lat, ID
     """
-    if seed is not None:
-        random.seed(seed)
+    if method == "triangulation":
+        def _sample_triangulated():
+            tri = load_triangulation(shapefile, id_column)
+            geom_idx, lons, lats = sample_points_from_triangulation(tri, n_points_per_geom, seed=seed)
+            tri_ids = tri["ids"].tolist()
+            results = [
+                {"lon": float(lon), "lat": float(lat), id_column: tri_ids[g]}
+                for g, lon, lat in zip(geom_idx, lons, lats)
+                if ids is None or tri_ids[g] in ids
+            ]
+            fallback_ids = set(tri["fallback_ids"].tolist())
+            if ids is not None:
+                fallback_ids &= set(ids)
+            results.extend(_sample_fallback_geometries(
+                shapefile, id_column, fallback_ids, n_points_per_geom, seed
+            ))
+            return results
+        return await asyncio.to_thread(_sample_triangulated)
+    elif method != "rejection":
+        raise ValueError(f"Unknown sampling method: {method}")
 
-    gdf = gpd.read_file(shapefile).to_crs(epsg=4326)
+    gdf = read_layer(shapefile)
 
-    sem = asyncio.Semaphore(max_concurrent)
+    # drop rows that can never yield a point
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna() & gdf[id_column].notna()]
+    if ids is not None:
+        gdf = gdf[gdf[id_column].astype(str).isin(set(ids))]
 
-    async def process_geometry(row):
-        async with sem:
-            geom = row.geometry
-            row_id = row.get(id_column, None)
-            results = []
+    # one independent stream per geometry keeps results reproducible regardless of scheduling
+    seeds = np.random.SeedSequence(seed).spawn(len(gdf))
+    tasks = [
+        (row_id, geom, n_points_per_geom, s)
+        for row_id, geom, s in zip(gdf[id_column], gdf.geometry, seeds)
+    ]
 
-            if geom.is_empty or row_id is None:
-                return results
+    n_workers = n_workers or os.cpu_count() or 1
+    n_chunks = min(len(tasks), n_workers * CHUNKS_PER_WORKER) or 1
+    chunks = [tasks[i::n_chunks] for i in range(n_chunks)]
 
-            minx, miny, maxx, maxy = geom.bounds
+    loop = asyncio.get_running_loop()
+    chunk_results = [None] * len(chunks)
 
-            for _ in range(n_points_per_geom):
-                for attempt in range(1000):
-                    lon = random.uniform(minx, maxx)
-                    lat = random.uniform(miny, maxy)
-                    point = Point(lon, lat)
-                    if geom.contains(point):
-                        results.append({"lon": lon, "lat": lat, id_column: row_id})
-                        break
-                else:
-                    print(f"⚠️ Warning: Could not sample point inside geometry {row_id}")
-            return results
+    async def run_chunk(executor, idx, chunk):
+        chunk_results[idx] = await loop.run_in_executor(executor, _sample_geometry_chunk, chunk)
 
-    tasks = [process_geometry(row) for _, row in gdf.iterrows()]
-    results = []
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [run_chunk(executor, i, chunk) for i, chunk in enumerate(chunks)]
+        for f in tqdm_asyncio.as_completed(futures, total=len(futures), desc="Sampling points"):
+            await f
 
-    for f in tqdm_asyncio.as_completed(tasks, total=len(tasks), desc="Sampling points"):
-        results.extend(await f)
+    results = []
+    for chunk in chunk_results:
+        for row_id, n_points, lons, lats in chunk:
+            if len(lons) < n_points:
+                print(f"⚠️ Warning: Could only sample {len(lons)}/{n_points} points inside geometry {row_id}")
+            results.extend(
+                {"lon": float(lon), "lat": float(lat), id_column: row_id}
+                for lon, lat in zip(lons, lats)
+            )
 
     return results
 
 
-async def generate_random_points_async(n_points, seed=None, n_workers=8):
+def load_land_mask(shapefile=LAND_MASK_SHAPEFILE):
+    """Dissolve the province/territory polygons into a single Canada land mask (EPSG:4326)."""
+    gdf = read_layer(shapefile)
+    return shapely.union_all(gdf.geometry.values)
+
+
+def _init_land_mask_worker(mask_wkb):
+    """Initializes each worker process with the prepared land mask."""
+    global LAND_MASK
+    if mask_wkb is None:
+        LAND_MASK = None
+        return
+    LAND_MASK = shapely.from_wkb(mask_wkb)
+    shapely.prepare(LAND_MASK)
+
+
+def _random_points_worker(n, seed):
     """
-    Generate N random points across Canada using ThreadPoolExecutor.
+    Worker function: draw n points in CANADA_BBOX that fall on the land mask.
+
+    At most MAX_SAMPLE_ATTEMPTS candidates are drawn per requested point; a
+    ValueError is raised if the mask yields fewer than n points within that.
     """
-    if seed is not None:
-        random.seed(seed)
+    rng = np.random.default_rng(seed)
+    budget = MAX_SAMPLE_ATTEMPTS * n
+    lons, lats = [], []
+    n_accepted = 0
 
-    def _worker(n):
-        chunk = []
-        for _ in range(n):
-            lon, lat = get_random_lon_lat_within_canada()
-            chunk.append({"lon": lon, "lat": lat, "ID": None})
-        return chunk
+    while n_accepted < n:
+        if budget <= 0:
+            raise ValueError(
+                f"Land mask accepted only {n_accepted} of {n} points after "
+                f"{MAX_SAMPLE_ATTEMPTS * n} candidates; does it intersect CANADA_BBOX {CANADA_BBOX}?"
+            )
+        remaining = n - n_accepted
+        batch = max(MIN_SAMPLE_BATCH, int(remaining * BATCH_OVERSAMPLE / LAND_FILL_RATIO))
+        batch = min(budget, batch)
+        budget -= batch
+        cand_lon = rng.uniform(CANADA_BBOX[0], CANADA_BBOX[2], batch)
+        cand_lat = rng.uniform(CANADA_BBOX[1], CANADA_BBOX[3], batch)
 
-    chunk_size = n_points // n_workers
-    results = []
+        if LAND_MASK is not None:
+            inside = shapely.contains_xy(LAND_MASK, cand_lon, cand_lat)
+            cand_lon, cand_lat = cand_lon[inside], cand_lat[inside]
+
+        lons.append(cand_lon[:remaining])
+        lats.append(cand_lat[:remaining])
+        n_accepted += len(lons[-1])
+
+    if not lons:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(lons), np.concatenate(lats)
+
+
+async def generate_random_points_async(n_points, seed=None, n_workers=8, land_mask=LAND_MASK_SHAPEFILE):
+    """
+    Generate N random points on land across Canada using a process pool.
+
+    Each worker gets its own NumPy Generator spawned from `seed`, so output is
+    reproducible for a given (seed, n_workers). Candidates are rejected against
+    the dissolved `land_mask` shapefile; pass land_mask=None to sample the raw bbox.
+    """
+    mask_wkb = shapely.to_wkb(load_land_mask(land_mask)) if land_mask is not None else None
+
+    # spread the remainder so exactly n_points are returned
+    quotas = [n_points // n_workers + (1 if i < n_points % n_workers else 0) for i in range(n_workers)]
+    seeds = np.random.SeedSequence(seed).spawn(n_workers)
 
     loop = asyncio.get_running_loop()
-    with ThreadPoolExecutor(max_workers=n_workers) as executor:
-        futures = [loop.run_in_executor(executor, _worker, chunk_size) for _ in range(n_workers)]
+    worker_results = [None] * n_workers
+
+    async def run_worker(executor, idx):
+        worker_results[idx] = await loop.run_in_executor(executor, _random_points_worker, quotas[idx], seeds[idx])
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers, initializer=_init_land_mask_worker, initargs=(mask_wkb,)
+    ) as executor:
+        futures = [run_worker(executor, i) for i in range(n_workers)]
         for f in tqdm_asyncio.as_completed(futures, total=n_workers, desc="Sampling random points"):
-            results.extend(await f)
-    return results[:n_points]
+            await f
+
+    results = []
+    for lons, lats in worker_results:
+        results.extend({"lon": float(lon), "lat": float(lat), "ID": None} for lon, lat in zip(lons, lats))
+    return results
+
+
+class SeparationGrid:
+    """
+    Grid-hash Poisson-disk index of points kept so far.
+
+    Distances are measured in SEPARATION_CRS. The grid cell size is
+    min_dist_m / sqrt(2), so only the surrounding 5x5 cells need checking.
+    """
+
+    def __init__(self, min_dist_m):
+        self.min_dist_sq = min_dist_m * min_dist_m
+        self.cell = min_dist_m / np.sqrt(2)
+        self.cells = {}
+        self._transformer = Transformer.from_crs("EPSG:4326", SEPARATION_CRS, always_xy=True)
+
+    def _project(self, lons, lats):
+        return self._transformer.transform(
+            np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+        )
+
+    def _too_close(self, x, y, cx, cy):
+        for dx in range(-2, 3):
+            for dy in range(-2, 3):
+                for px, py in self.cells.get((cx + dx, cy + dy), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < self.min_dist_sq:
+                        return True
+        return False
+
+    def seed(self, lons, lats):
+        """Register points that are already placed, without checking them."""
+        xs, ys = self._project(lons, lats)
+        for x, y in zip(xs, ys):
+            self.cells.setdefault((int(np.floor(x / self.cell)), int(np.floor(y / self.cell))), []).append((x, y))
+
+    def add(self, lons, lats):
+        """
+        Keep points in order, dropping any point closer than min_dist_m to one
+        already kept (or seeded).
+
+        Returns:
+            boolean keep mask
+        """
+        xs, ys = self._project(lons, lats)
+        cxs = np.floor(xs / self.cell).astype(np.int64)
+        cys = np.floor(ys / self.cell).astype(np.int64)
+
+        keep = np.zeros(len(xs), dtype=bool)
+        for i in range(len(xs)):
+            x, y, cx, cy = xs[i], ys[i], int(cxs[i]), int(cys[i])
+            if not self._too_close(x, y, cx, cy):
+                self.cells.setdefault((cx, cy), []).append((x, y))
+                keep[i] = True
+        return keep
+
+
+def min_separation_mask(lons, lats, min_dist_m, existing=None):
+    """
+    Greedy thinning: keep points in order, dropping any point closer than
+    min_dist_m to one already kept or to the (lons, lats) `existing` points.
+
+    Returns:
+        boolean keep mask
+    """
+    grid = SeparationGrid(min_dist_m)
+    if existing is not None:
+        grid.seed(*existing)
+    return grid.add(lons, lats)
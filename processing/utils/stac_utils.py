@@ -0,0 +1,125 @@
+import time
+import random
+import asyncio
+import aiohttp
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 60.0
+LATENCY_FACTOR = 2.0  # hold growth when latency exceeds this multiple of the best seen
+
+
+class StacError(Exception):
+    """A STAC request that still failed after all retries."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by ~1 slot per window of successes, halves
+    on throttling (429/5xx/timeouts) at most once per backoff period, and stops
+    growing while latency is well above the best observed.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=50):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.best_latency = None
+        self.latency = None
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        if self.latency <= LATENCY_FACTOR * self.best_latency:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease < BACKOFF_BASE:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class StacClient:
+    """
+    Async STAC search client with adaptive concurrency, jittered exponential
+    backoff and `next`-link pagination.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url, limiter: AdaptiveLimiter = None,
+                 max_retries=MAX_RETRIES):
+        self.session = session
+        self.url = url
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+
+    async def _request(self, method, url, params=None, json=None):
+        """One page request, retried on throttling and transport errors."""
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self.limiter:
+                    start = time.monotonic()
+                    async with self.session.request(method, url, params=params, json=json) as response:
+                        if response.status == 200:
+                            data = await response.json()
+                            self.limiter.on_success(time.monotonic() - start)
+                            return data
+                        if response.status not in RETRY_STATUSES:
+                            text = await response.text()
+                            raise StacError(f"HTTP {response.status}: {text[:200]}")
+                        self.limiter.on_throttle()
+                        retry_after = response.headers.get("Retry-After")
+                        error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.limiter.on_throttle()
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt == self.max_retries:
+                raise StacError(f"{error} after {attempt + 1} attempts")
+
+            # full jitter, but never sooner than the server asked for
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    async def search(self, params, max_pages=None):
+        """
+        Run a GET search and follow `next` links until exhausted.
+
+        Returns:
+            list of feature dicts from every page
+        """
+        return await self.get_pages(self.url, params, max_pages)
+
+    async def get_pages(self, url, params=None, max_pages=None):
+        """GET any paginated feature endpoint (search or /collections/{id}/items)."""
+        features = []
+        data = await self._request("GET", url, params=params)
+        pages = 1
+        while True:
+            features.extend(data.get("features", []))
+            next_link = next((link for link in data.get("links", []) if link.get("rel") == "next"), None)
+            if next_link is None or (max_pages is not None and pages >= max_pages):
+                return features
+            method = next_link.get("method", "GET").upper()
+            data = await self._request(method, next_link["href"], json=next_link.get("body"))
+            pages += 1
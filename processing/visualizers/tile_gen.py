@@ -1,5 +1,5 @@
 import duckdb
-import geopandas as gpd
+from processing.utils.layer_utils import BOUNDS_COLUMNS, read_layer
 import json
 import os
 import subprocess
@@ -50,9 +50,9 @@ layers = {
 }
 geojson_paths = {}
 for lname, folder in layers.items():
-    gdf = gpd.read_file(folder)
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
+    gdf = read_layer(folder)
+    # cached bounds are lookup helpers, not tile attributes
+    gdf = gdf.drop(columns=BOUNDS_COLUMNS, errors="ignore")
     gdf = gdf.explode(index_parts=False)
     gdf["layer"] = lname
     out_path = f"./data/outputs/{lname}.geojson"
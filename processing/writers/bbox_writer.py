@@ -1,11 +1,12 @@
 import asyncio
+from collections import defaultdict
+import numpy as np
 import pyarrow as pa
 from pystac_client import Client
-from concurrent.futures import ThreadPoolExecutor
 from tqdm.asyncio import tqdm_asyncio
-from processing.utils.bbox_utils import get_bbox_from_point
+from processing.utils.bbox_utils import get_bboxes_from_points
 from processing.utils.point_utils import (
-  sample_points_per_geometry, generate_random_points_async
+  sample_points_per_geometry, generate_random_points_async, SeparationGrid
 )
 from processing.utils.census_utils import CanadaHierarchy
 
@@ -14,6 +15,49 @@ POINTS_PER_CSD = 2  # 5161 per
 POINTS_PER_CD = 40  # 293 per
 POINTS_PER_PR = 1000  # 13 per
 POINTS_OVER_CANADA = 25_000  # 1 per
+SAMPLING_METHOD = "rejection"  # or "triangulation" (needs shapely >= 2.1)
+MIN_SEPARATION_M = None  # e.g. 5120 (256 px @ 20 m) for non-overlapping tiles
+MAX_SEPARATION_ROUNDS = 10  # draws per source before accepting a shortfall
+
+
+async def _sample_separated(draw, id_column, quota, grid):
+    """
+    Draw points for one source until every geometry has `quota` points at
+    least MIN_SEPARATION_M from every point kept so far.
+
+    draw(deficits) samples candidates; deficits is None on the first round and
+    then maps each geometry ID still short of its quota to its shortfall.
+    Geometries are redrawn at most MAX_SEPARATION_ROUNDS times in total.
+    """
+    kept = []
+    deficits = None
+    for _ in range(MAX_SEPARATION_ROUNDS):
+        candidates = await draw(deficits)
+        if deficits is None:
+            deficits = {p.get(id_column): quota for p in candidates}
+
+        # never offer a geometry more candidates than it is short
+        offered = defaultdict(int)
+        batch = []
+        for p in candidates:
+            key = p.get(id_column)
+            if offered[key] < deficits.get(key, 0):
+                offered[key] += 1
+                batch.append(p)
+
+        keep = grid.add([p["lon"] for p in batch], [p["lat"] for p in batch])
+        for p, k in zip(batch, keep):
+            if k:
+                kept.append(p)
+                deficits[p.get(id_column)] -= 1
+        deficits = {key: n for key, n in deficits.items() if n > 0}
+        if not deficits:
+            break
+
+    if deficits:
+        print(f"⚠️ {sum(deficits.values())} points short for {len(deficits)} geometries "
+              f"after {MAX_SEPARATION_ROUNDS} draws at {MIN_SEPARATION_M} m separation")
+    return kept
 
 
 def create_bbox_table(con):
@@ -38,57 +82,82 @@ def create_bbox_table(con):
         """)
 
 
-async def insert_points_async(con):
+async def insert_points_async(con, append=False):
+    """
+    Sample points and insert them into canada_bboxes.
+
+    The sample is inserted in one statement, so the table either has a whole
+    sample or none. If rows already exist (a rerun, or a crash before the stage
+    was marked complete) nothing is sampled unless append=True, which adds a
+    further sample after the existing ids.
+    """
     loop = asyncio.get_running_loop()
 
+    n_existing = con.execute("SELECT COUNT(*) FROM canada_bboxes").fetchone()[0]
+    if n_existing and not append:
+        print(f"✅ canada_bboxes already has {n_existing} points; skipping sampling.")
+        return
+
     # --- 1) Sample points asynchronously ---
-    csd_points = await sample_points_per_geometry("./data/inputs/census_subdiv", "CSDUID", n_points_per_geom=POINTS_PER_CSD)
-    cd_points = await sample_points_per_geometry("./data/inputs/census_div", "CDUID", n_points_per_geom=POINTS_PER_CD)
-    pr_points = await sample_points_per_geometry("./data/inputs/prov_terr", "PRUID", n_points_per_geom=POINTS_PER_PR)
-    rand_points = await generate_random_points_async(POINTS_OVER_CANADA)
+    def geometry_source(shapefile, id_column, n_points):
+        async def draw(deficits):
+            return await sample_points_per_geometry(
+                shapefile, id_column, n_points_per_geom=n_points, method=SAMPLING_METHOD,
+                ids=None if deficits is None else {str(key) for key in deficits},
+            )
+        return draw, id_column, n_points
+
+    async def draw_random(deficits):
+        return await generate_random_points_async(
+            POINTS_OVER_CANADA if deficits is None else sum(deficits.values())
+        )
+
+    # Sources are in priority order (CSD first), so small regions claim their space first
+    sources = [
+        ("CSD", *geometry_source("./data/inputs/census_subdiv", "CSDUID", POINTS_PER_CSD)),
+        ("CD", *geometry_source("./data/inputs/census_div", "CDUID", POINTS_PER_CD)),
+        ("PR", *geometry_source("./data/inputs/prov_terr", "PRUID", POINTS_PER_PR)),
+        ("RAND", draw_random, "ID", POINTS_OVER_CANADA),
+    ]
+
+    grid = None
+    if MIN_SEPARATION_M is not None:
+        # keep appended samples apart from the points already in the table too
+        grid = SeparationGrid(MIN_SEPARATION_M)
+        existing = con.execute("SELECT lon, lat FROM canada_bboxes").fetchnumpy()
+        grid.seed(existing["lon"], existing["lat"])
 
     all_points = []
-    for pts, src in [(csd_points, "CSD"), (cd_points, "CD"), (pr_points, "PR"), (rand_points, "RAND")]:
-        print(f"✅ {len(pts)} points sampled from {src}")
+    for src, draw, id_column, quota in sources:
+        if grid is None:
+            pts = await draw(None)
+            print(f"✅ {len(pts)} points sampled from {src}")
+        else:
+            pts = await _sample_separated(draw, id_column, quota, grid)
+            print(f"✅ {len(pts)} points sampled from {src} at {MIN_SEPARATION_M} m minimum separation")
         all_points.extend(pts)
 
-    # --- 2) Calculate hierarchies across threads ---
-    hierarchy_helper = CanadaHierarchy()
-    hierarchies = [None] * len(all_points)
-
-    def calc_hierarchy(idx_pt):
-        idx, pt = idx_pt
-        return idx, hierarchy_helper.infer_hierarchy(pt)
+    # Append after any existing rows so appended samples don't collide on primary keys
+    start_id = con.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM canada_bboxes").fetchone()[0]
 
-    with ThreadPoolExecutor() as executor:
-        futures = [loop.run_in_executor(executor, calc_hierarchy, (i, pt)) for i, pt in enumerate(all_points)]
-        for f in tqdm_asyncio.as_completed(futures, total=len(futures), desc="Calculating hierarchy"):
-            idx, hierarchy = await f
-            hierarchies[idx] = hierarchy
+    # --- 2) Calculate hierarchies as columns ---
+    hierarchy = CanadaHierarchy().infer_hierarchy_batch(
+        [p.get("CSDUID") for p in all_points],
+        [p.get("CDUID") for p in all_points],
+        [p.get("PRUID") for p in all_points],
+    )
 
     # --- 3) Construct a single PyArrow Table ---
-    # Prepare lists of column data
-    ids = list(range(1, len(all_points) + 1))
-    lons = [p["lon"] for p in all_points]
-    lats = [p["lat"] for p in all_points]
-    pr_names = [h.get("PRNAME") for h in hierarchies]
-    pr_uids = [h.get("PRUID") for h in hierarchies]
-    cd_names = [h.get("CDNAME") for h in hierarchies]
-    cd_uids = [h.get("CDUID") for h in hierarchies]
-    csd_names = [h.get("CSDNAME") for h in hierarchies]
-    csd_uids = [h.get("CSDUID") for h in hierarchies]
-
-    # Create the PyArrow Table from the column data
     arrow_table = pa.Table.from_pydict({
-        "id": ids,
-        "lon": lons,
-        "lat": lats,
-        "province": pr_names,
-        "province_id": pr_uids,
-        "census_div": cd_names,
-        "census_div_id": cd_uids,
-        "census_subdiv": csd_names,
-        "census_subdiv_id": csd_uids
+        "id": pa.array(np.arange(start_id, start_id + len(all_points), dtype=np.int32)),
+        "lon": [p["lon"] for p in all_points],
+        "lat": [p["lat"] for p in all_points],
+        "province": hierarchy["PRNAME"],
+        "province_id": hierarchy["PRUID"],
+        "census_div": hierarchy["CDNAME"],
+        "census_div_id": hierarchy["CDUID"],
+        "census_subdiv": hierarchy["CSDNAME"],
+        "census_subdiv_id": hierarchy["CSDUID"],
     })
 
     # --- 4) Perform single, high-performance insert from PyArrow Table ---
@@ -113,41 +182,31 @@ async def insert_points_async(con):
 async def update_bboxes_async(con, resolution_m, tile_size):
     loop = asyncio.get_running_loop()
 
-    # --- 1) Fetch existing points ---
-    rows = await loop.run_in_executor(None, lambda: con.execute(
-        "SELECT id, lon, lat FROM canada_bboxes"
-    ).fetchall())
-    print(f"📦 Retrieved {len(rows)} rows from DB")
-
-    # --- 2) Compute bbox/resolution across threads ---
-    def compute_bbox(row):
-        row_id, lon, lat = row
-        bbox_info = get_bbox_from_point(lon, lat, resolution_m, tile_size)
-        return {
-            "id": row_id,
-            "bbox": bbox_info["bbox"],
-            "resolution_deg": bbox_info["deg_resolution"],
-            "resolution_m": resolution_m,
-            "tile_size": tile_size
-        }
+    # --- 1) Fetch points without a bbox as columns ---
+    cols = await loop.run_in_executor(None, lambda: con.execute(
+        "SELECT id, lon, lat FROM canada_bboxes WHERE bbox IS NULL"
+    ).fetchnumpy())
+    n_rows = len(cols["id"])
+    print(f"📦 Retrieved {n_rows} rows from DB")
+    if n_rows == 0:
+        return
 
-    results = []
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            loop.run_in_executor(executor, compute_bbox, row)
-            for row in rows
-        ]
-        for f in tqdm_asyncio.as_completed(futures, total=len(futures), desc="Calculating bboxes"):
-            result = await f
-            results.append(result)
+    # --- 2) Compute bbox/resolution in one vectorized pass ---
+    bbox_info = get_bboxes_from_points(cols["lon"], cols["lat"], resolution_m, tile_size)
+
+    def _list_column(values):
+        # (N, k) array -> Arrow list<double> column without per-row Python lists
+        n, k = values.shape
+        offsets = pa.array(np.arange(0, (n + 1) * k, k, dtype=np.int32))
+        return pa.ListArray.from_arrays(offsets, pa.array(values.ravel()))
 
     # --- 3) Construct a single PyArrow Table ---
     arrow_table = pa.Table.from_pydict({
-        "id": [r["id"] for r in results],
-        "bbox": [r["bbox"] for r in results],
-        "resolution_deg": [r["resolution_deg"] for r in results],
-        "resolution_m": [r["resolution_m"] for r in results],
-        "tile_size": [r["tile_size"] for r in results],
+        "id": pa.array(cols["id"]),
+        "bbox": _list_column(bbox_info["bbox"]),
+        "resolution_deg": _list_column(bbox_info["deg_resolution"]),
+        "resolution_m": pa.array(np.full(n_rows, resolution_m, dtype=np.float64)),
+        "tile_size": pa.array(np.full(n_rows, tile_size, dtype=np.int32)),
     })
 
     # --- 4) Perform single, high-performance update ---
@@ -168,7 +227,7 @@ async def update_bboxes_async(con, resolution_m, tile_size):
         """)
     )
 
-    print(f"✅ Updated bbox and resolution for {len(rows)} points.")
+    print(f"✅ Updated bbox and resolution for {n_rows} points.")
 
 
 async def update_rcm_items(con):
@@ -1,63 +1,29 @@
 import duckdb
-import geopandas as gpd
-import pandas as pd
-from multiprocessing import Pool, cpu_count
+import numpy as np
+import pyarrow as pa
 import asyncio
-from processing.utils.census_utils import CanadaHierarchy
-
-# Instantiate hierarchy helper once (multiprocess-safe)
-hierarchy = CanadaHierarchy()
-
-
-def _process_chunk(chunk: pd.DataFrame):
-    """Process a chunk of joined data and infer hierarchy."""
-    processed_rows = []
-    for _, row in chunk.iterrows():
-        id_ = row["id"]
-        if pd.notnull(row.get("CSDUID")):
-            pt = {
-                "CSDUID": row.get("CSDUID"),
-                "CDUID": row.get("CDUID"),
-                "PRUID": row.get("PRUID"),
-            }
-            h = hierarchy.infer_hierarchy(pt)
-            processed_rows.append(
-                (
-                    id_,
-                    h["CSDUID"],
-                    h["CSDNAME"],
-                    h["CDUID"],
-                    h["CDNAME"],
-                    h["PRUID"],
-                    h["PRNAME"],
-                )
-            )
-    return processed_rows
+from processing.utils.census_utils import CanadaHierarchy, CensusResolver
 
 
 async def update_census_data(
     con: duckdb.DuckDBPyConnection,
-    csd_gdf_path: str = "./data/inputs/census_subdiv",
+    resolver: CensusResolver = None,
 ):
     """
     Async: Updates the 'canada_bboxes' table in DuckDB with census data.
-    Performs spatial join + hierarchy inference with multiprocessing.
+    Resolves points province -> CD -> CSD with a CensusResolver, reusing any
+    province/CD IDs already known from sampling. Pass a resolver to reuse its
+    loaded layers across calls.
     """
 
     def _sync_work():
-        # --- Load shapefile ---
-        print(f"Loading census shapefile from {csd_gdf_path}...")
-        csd_gdf = gpd.read_file(csd_gdf_path)
-
-        # Reproject if necessary
-        if csd_gdf.crs is None or csd_gdf.crs.to_epsg() != 4326:
-            csd_gdf = csd_gdf.to_crs(epsg=4326)
+        nonlocal resolver
 
         # --- Get rows needing update ---
         print("Fetching records with missing census subdivision data...")
         df = con.execute(
             """
-            SELECT id, lon, lat
+            SELECT id, lon, lat, province_id, census_div_id
             FROM canada_bboxes
             WHERE census_subdiv_id IS NULL
             """
@@ -67,52 +33,40 @@ async def update_census_data(
             print("No records with missing census subdivision ID found. Exiting.")
             return
 
-        # --- Build geometries (vectorized, fast) ---
-        points = gpd.GeoDataFrame(
-            df,
-            geometry=gpd.points_from_xy(df["lon"], df["lat"]),
-            crs="EPSG:4326",
+        # --- Load layers once ---
+        if resolver is None:
+            print("Loading census layers...")
+            resolver = CensusResolver()
+
+        # --- Hierarchical point-in-polygon ---
+        print(f"Resolving census hierarchy for {len(df)} points...")
+        resolved = resolver.resolve(
+            df["lon"], df["lat"], pruids=df["province_id"], cduids=df["census_div_id"]
         )
 
-        # --- Spatial join ---
-        print(f"Performing spatial join for {len(points)} points...")
-        joined = gpd.sjoin(points, csd_gdf, how="left", predicate="within")
+        def _nullable(key):
+            values, valid = resolved[key]
+            return np.where(valid, values, np.nan)
 
-        # --- Hierarchy inference (multiprocess) ---
-        print(f"Inferring hierarchy for {len(joined)} joined records...")
-        if len(joined) < 1000:
-            # small dataset → single process
-            processed_data = _process_chunk(joined)
-        else:
-            num_processes = cpu_count()
-            chunk_size = max(1, len(joined) // num_processes)
-            chunks = [
-                joined.iloc[i : i + chunk_size]
-                for i in range(0, len(joined), chunk_size)
-            ]
-            with Pool(processes=num_processes) as pool:
-                processed_data_list = pool.map(_process_chunk, chunks)
-            processed_data = [
-                item for sublist in processed_data_list for item in sublist
-            ]
+        hierarchy = CanadaHierarchy().infer_hierarchy_batch(
+            _nullable("CSDUID"), _nullable("CDUID"), _nullable("PRUID")
+        )
 
         # --- Bulk update ---
-        if processed_data:
-            print(f"Preparing {len(processed_data)} records for bulk update...")
-            update_df = pd.DataFrame(
-                processed_data,
-                columns=[
-                    "id",
-                    "census_subdiv_id",
-                    "census_subdiv",
-                    "census_div_id",
-                    "census_div",
-                    "province_id",
-                    "province",
-                ],
-            )
-
-            con.register("updates", update_df)
+        has_pr = resolved["PRUID"][1]
+        if has_pr.any():
+            print(f"Preparing {int(has_pr.sum())} records for bulk update...")
+            update_table = pa.table({
+                "id": pa.array(df["id"].to_numpy()),
+                "census_subdiv_id": hierarchy["CSDUID"],
+                "census_subdiv": hierarchy["CSDNAME"],
+                "census_div_id": hierarchy["CDUID"],
+                "census_div": hierarchy["CDNAME"],
+                "province_id": hierarchy["PRUID"],
+                "province": hierarchy["PRNAME"],
+            }).filter(pa.array(has_pr))
+
+            con.register("updates", update_table)
 
             print("Executing bulk update via SQL join...")
             con.execute(
@@ -128,10 +82,11 @@ async def update_census_data(
                 WHERE canada_bboxes.id = u.id
                 """
             )
+            con.unregister("updates")
 
             print("Bulk update finished.")
         else:
-            print("No matching census subdivisions found. No update performed.")
+            print("No points fell inside any census region. No update performed.")
 
     # Run heavy sync work in a thread so async loop is not blocked
     await asyncio.to_thread(_sync_work)
@@ -1,17 +1,30 @@
+import os
 import asyncio
+from xml.sax.saxutils import escape
 import numpy as np
 import rasterio
 import pyarrow as pa
+from rasterio.enums import Resampling
+from rasterio.windows import Window
 from pyproj import Transformer
 from concurrent.futures import ProcessPoolExecutor
 from tqdm.asyncio import tqdm_asyncio
-from processing.utils.landcover_utils import compute_entropy
+from processing.utils.cog_utils import CachedRangeOpener, is_remote
+from processing.utils.landcover_utils import BBOX_CRS, bbox_windows, compute_entropy, morton_code
 
 # Global variables for the worker processes
 RASTER_SRC = None
 TRANSFORMER = None
+LABEL_STORE = None
 NUM_CLASSES = 19
-BBOX_CRS = 'EPSG:4326'
+UNIT_BLOCKS = 4  # work unit edge length in raster blocks
+MAX_IN_FLIGHT = 64  # work units queued on the process pool at once
+FLUSH_ROWS = 50_000  # rows buffered before each insert
+LABEL_CHUNK = 16  # bboxes per label-resampling step
+LANDCOVER_COG_URL = (
+    "https://datacube-prod-data-public.s3.ca-central-1.amazonaws.com/"
+    "store/land/landcover/landcover-2020-classification.tif"
+)  # pass as landcover_tiff_path to skip the full download
 
 
 def create_landcover_table(con):
@@ -22,105 +35,611 @@ def create_landcover_table(con):
             nodata BIGINT,
             total_count BIGINT,
             {class_cols},
-            entropy DOUBLE
+            entropy DOUBLE,
+            decimation INTEGER,
+            approx_error DOUBLE
         )
     """)
+    # tables created before approximate mode
+    con.execute("ALTER TABLE landcover_stats ADD COLUMN IF NOT EXISTS decimation INTEGER")
+    con.execute("ALTER TABLE landcover_stats ADD COLUMN IF NOT EXISTS approx_error DOUBLE")
 
 
-def init_worker(tiff_path):
-    """Initializes each worker process by opening the GeoTIFF."""
-    global RASTER_SRC, TRANSFORMER
-    RASTER_SRC = rasterio.open(tiff_path)
-    dst_crs = RASTER_SRC.crs
-    TRANSFORMER = Transformer.from_crs(BBOX_CRS, dst_crs, always_xy=True)
+def open_landcover(path):
+    """
+    Open a landcover raster. http(s) URLs are read as COGs over range requests
+    through the shared on-disk block cache, so only touched blocks are fetched.
+    """
+    if is_remote(path):
+        return rasterio.open(path, opener=CachedRangeOpener())
+    return rasterio.open(path)
 
 
-def process_row_mp(row):
-    """Worker function for cropping and stats, run by a process pool."""
-    row_id, bbox = row
-    lon_min, lat_min, lon_max, lat_max = bbox
+def init_worker(tiff_path, label_store_path=None):
+    """Initializes each worker process by opening the GeoTIFF (and label store, if any)."""
+    global RASTER_SRC, TRANSFORMER, LABEL_STORE
+    RASTER_SRC = open_landcover(tiff_path)
+    TRANSFORMER = Transformer.from_crs(BBOX_CRS, RASTER_SRC.crs, always_xy=True)
+    LABEL_STORE = np.load(label_store_path, mmap_mode="r+") if label_store_path else None
 
-    # Transform bbox coordinates into TIFF CRS
-    minx, miny = TRANSFORMER.transform(lon_min, lat_min)
-    maxx, maxy = TRANSFORMER.transform(lon_max, lat_max)
 
-    # Check overlap with dataset bounds
-    tif_bounds = RASTER_SRC.bounds
-    if not (maxx > tif_bounds.left and minx < tif_bounds.right and
-            maxy > tif_bounds.bottom and miny < tif_bounds.top):
-        return {
-            "id": row_id,
-            "nodata": 0,
-            "total_count": -1,
-            "counts": np.zeros(NUM_CLASSES, dtype=np.int64),
-            "entropy": 0.0,
-        }
+def open_label_store(path, n_slots, label_size):
+    """
+    Create or grow the packed uint8 label store: an (n_slots, label_size, label_size)
+    .npy memmap where slot i holds the label patch of bbox id i.
+    """
+    if os.path.exists(path):
+        store = np.load(path, mmap_mode="r")
+        if store.shape[0] >= n_slots and store.shape[1:] == (label_size, label_size):
+            return path
+        old = store
+    else:
+        old = None
 
-    # Create window in raster pixel coordinates (no resampling)
-    window = rasterio.windows.from_bounds(minx, miny, maxx, maxy, RASTER_SRC.transform)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp.npy"
+    store = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(n_slots, label_size, label_size))
+    if old is not None and old.shape[1:] == store.shape[1:]:
+        store[:old.shape[0]] = old
+    store.flush()
+    del store, old
+    os.replace(tmp_path, path)
+    return path
 
-    # Read data at native resolution
-    data = RASTER_SRC.read(1, window=window)
 
-    # Count nodata (assuming 0 is nodata for this TIFF)
-    nodata_count = np.sum(data == 0)
+def _write_label_patches(ids, bboxes, data, r0, c0):
+    """
+    Nearest-neighbour label patches on each bbox's tile grid, taken from the
+    already-read union window, written to the label store by id.
 
-    # Count classes 1–19 using bincount
-    counts_bin = np.bincount(data.flatten(), minlength=NUM_CLASSES + 1)
-    counts = counts_bin[1:]
+    The bbox corners are the centres of the tile's edge pixels (see
+    get_bbox_from_point), so the grid is linspace over the bbox.
+    """
+    n = LABEL_STORE.shape[1]
+    steps = np.linspace(0.0, 1.0, n)
+    t = RASTER_SRC.transform
 
-    # Total classified pixels (non-nodata)
-    total_count = counts.sum()
+    # a few bboxes at a time keeps the coordinate grids small
+    for start in range(0, len(ids), LABEL_CHUNK):
+        chunk_ids = ids[start:start + LABEL_CHUNK]
+        chunk = bboxes[start:start + LABEL_CHUNK]
+        k = len(chunk_ids)
 
-    # Entropy (ignore nodata)
-    entropy = compute_entropy(counts)
-
-    return {
-        "id": row_id,
-        "nodata": nodata_count,
-        "total_count": total_count,
-        "counts": counts,
-        "entropy": entropy
+        lons = chunk[:, 0, None] + steps[None, :] * (chunk[:, 2] - chunk[:, 0])[:, None]
+        lats = chunk[:, 3, None] - steps[None, :] * (chunk[:, 3] - chunk[:, 1])[:, None]
+        grid_lon = np.broadcast_to(lons[:, None, :], (k, n, n))
+        grid_lat = np.broadcast_to(lats[:, :, None], (k, n, n))
+
+        x, y = TRANSFORMER.transform(grid_lon, grid_lat)
+        rows = np.floor((y - t.f) / t.e).astype(np.int64) - r0
+        cols = np.floor((x - t.c) / t.a).astype(np.int64) - c0
+        valid = (rows >= 0) & (rows < data.shape[0]) & (cols >= 0) & (cols < data.shape[1])
+
+        patches = np.zeros((k, n, n), dtype=np.uint8)
+        patches[valid] = data[rows[valid], cols[valid]]
+        for row_id, patch in zip(chunk_ids, patches):
+            LABEL_STORE[row_id] = patch
+
+
+def _stats_batch(ids, counts_bin, total_count=None, decimation=1, n_samples=None):
+    """
+    Columnar stats for a chunk of bboxes as one Arrow RecordBatch.
+
+    counts_bin is an (N, NUM_CLASSES + 1) matrix whose column 0 is nodata.
+    For decimated reads, n_samples is the number of pixels actually read per
+    bbox and approx_error is 1 / sqrt(n_samples), an estimate of the error of
+    each class fraction (about two standard errors of a proportion sampled
+    from independent pixels). It is a sampling-noise heuristic, not a bound:
+    landcover is spatially correlated, so real errors can be larger.
+    """
+    counts = counts_bin[:, 1:NUM_CLASSES + 1]
+    if total_count is None:
+        # Total classified pixels (non-nodata)
+        total_count = counts.sum(axis=1)
+
+    columns = {
+        "id": pa.array(np.asarray(ids, dtype=np.int32)),
+        "nodata": pa.array(counts_bin[:, 0].astype(np.int64)),
+        "total_count": pa.array(np.asarray(total_count, dtype=np.int64)),
     }
+    for i in range(NUM_CLASSES):
+        columns[f"class_{i+1}"] = pa.array(counts[:, i].astype(np.int64))
+    # Entropy (ignore nodata)
+    columns["entropy"] = pa.array(compute_entropy(counts))
+
+    columns["decimation"] = pa.array(np.full(len(ids), decimation, dtype=np.int32))
+    if decimation == 1:
+        approx_error = np.zeros(len(ids))
+    else:
+        approx_error = 1.0 / np.sqrt(np.maximum(n_samples, 1))
+    columns["approx_error"] = pa.array(approx_error)
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def _empty_batch(ids):
+    """Stats for bboxes that do not overlap the raster."""
+    return _stats_batch(
+        ids, np.zeros((len(ids), NUM_CLASSES + 1), dtype=np.int64), total_count=np.full(len(ids), -1)
+    )
+
+
+def _histograms(crops):
+    """
+    Class histograms for many crops with a single bincount.
+
+    Each crop's pixels are offset into its own row of bins; values above
+    NUM_CLASSES land in a spare bin that is dropped.
+    """
+    n_bins = NUM_CLASSES + 2
+    flat = [np.minimum(c.ravel(), NUM_CLASSES + 1).astype(np.int64) + i * n_bins for i, c in enumerate(crops)]
+    if not flat:
+        return np.zeros((0, NUM_CLASSES + 1), dtype=np.int64)
+    counts = np.bincount(np.concatenate(flat), minlength=len(crops) * n_bins)
+    # Count nodata (assuming 0 is nodata for this TIFF) and classes 1–19
+    return counts.reshape(len(crops), n_bins)[:, :NUM_CLASSES + 1]
+
+
+def plan_work_units(ids, windows, bboxes, block_shape, unit_blocks=UNIT_BLOCKS):
+    """
+    Order bboxes along a Z-order curve over raster blocks and group them into
+    work units of unit_blocks x unit_blocks blocks, so each unit is one
+    mostly-contiguous read.
+
+    Returns:
+        list of (ids, windows, bboxes) tuples in curve order
+    """
+    if len(ids) == 0:
+        return []
+    block_h, block_w = block_shape
+    block_r = windows[:, 0] // block_h
+    block_c = windows[:, 1] // block_w
+    unit_code = morton_code(block_c // unit_blocks, block_r // unit_blocks)
+    block_code = morton_code(block_c, block_r)
+
+    order = np.lexsort((block_code, unit_code))
+    ids = np.asarray(ids)[order]
+    windows = windows[order]
+    bboxes = bboxes[order]
+    unit_code = unit_code[order]
+
+    splits = np.flatnonzero(np.diff(unit_code)) + 1
+    return [
+        (unit_ids.tolist(), unit_windows, unit_bboxes)
+        for unit_ids, unit_windows, unit_bboxes in zip(
+            np.split(ids, splits), np.split(windows, splits), np.split(bboxes, splits)
+        )
+    ]
+
+
+def process_unit_mp(unit, decimation=1):
+    """
+    Worker function run by a process pool: read a work unit's union window
+    once and return every contained bbox's stats as one Arrow RecordBatch.
+
+    With decimation > 1 the window is read at 1/decimation resolution
+    (GDAL serves this from internal overviews when present) and counts are
+    scaled back up to full-resolution pixel estimates.
+    """
+    ids, windows, bboxes = unit
+    r0, c0 = windows[:, 0].min(), windows[:, 1].min()
+    r1 = (windows[:, 0] + windows[:, 2]).max()
+    c1 = (windows[:, 1] + windows[:, 3]).max()
+    window = Window(c0, r0, c1 - c0, r1 - r0)
+
+    if decimation == 1:
+        data = RASTER_SRC.read(1, window=window)
+        crops = [
+            data[row_off - r0:row_off - r0 + height, col_off - c0:col_off - c0 + width]
+            for row_off, col_off, height, width in windows
+        ]
+        if LABEL_STORE is not None:
+            _write_label_patches(ids, bboxes, data, r0, c0)
+        return _stats_batch(ids, _histograms(crops))
+
+    out_shape = (-(-(r1 - r0) // decimation), -(-(c1 - c0) // decimation))
+    data = RASTER_SRC.read(1, window=window, out_shape=out_shape, resampling=Resampling.nearest)
+    crops = [
+        data[(row_off - r0) // decimation:-(-(row_off - r0 + height) // decimation),
+             (col_off - c0) // decimation:-(-(col_off - c0 + width) // decimation)]
+        for row_off, col_off, height, width in windows
+    ]
+    n_samples = np.array([c.size for c in crops])
+    scale = windows[:, 2] * windows[:, 3] / np.maximum(n_samples, 1)
+    counts_bin = np.rint(_histograms(crops) * scale[:, None]).astype(np.int64)
+    return _stats_batch(ids, counts_bin, decimation=decimation, n_samples=n_samples)
+
+
+def _fetch_bboxes(con, sql):
+    """Run a query returning (id, bbox) and return compact (ids, (N, 4) bboxes) arrays."""
+    table = con.execute(sql).fetch_arrow_table()
+    ids = table["id"].to_numpy()
+    bboxes = table["bbox"].combine_chunks().flatten().to_numpy(zero_copy_only=False).reshape(-1, 4)
+    return ids, bboxes
+
+
+class _BatchInserter:
+    """
+    Buffers Arrow batches/tables and inserts them into a table every FLUSH_ROWS rows.
+    before_flush runs ahead of each insert (e.g. to flush a dependent table first).
+    """
+
+    def __init__(self, con, table, replace=False, flush_rows=FLUSH_ROWS, before_flush=None):
+        self.con = con
+        self.table = table
+        self.replace = replace
+        self.flush_rows = flush_rows
+        self.before_flush = before_flush
+        self.pending = []
+        self.n_pending = 0
+        self.n_written = 0
+
+    def add(self, batch):
+        if batch.num_rows == 0:
+            return
+        if isinstance(batch, pa.RecordBatch):
+            batch = pa.Table.from_batches([batch])
+        self.pending.append(batch)
+        self.n_pending += batch.num_rows
+        if self.n_pending >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self.before_flush is not None:
+            self.before_flush()
+        if not self.pending:
+            return
+        arrow_table = pa.concat_tables(self.pending)
+        view = f"{self.table}_view"
+        self.con.register(view, arrow_table)
+        if self.replace:
+            self.con.execute(f"DELETE FROM {self.table} WHERE id IN (SELECT id FROM {view})")
+        self.con.execute(f"""
+            INSERT INTO {self.table} BY NAME
+            SELECT * FROM {view}
+        """)
+        self.con.unregister(view)
+        self.n_written += arrow_table.num_rows
+        self.pending, self.n_pending = [], 0
+
+
+async def _map_units(units, worker, initargs, on_result, *args):
+    """
+    Run worker(unit, *args) over work units on a process pool, keeping at most
+    MAX_IN_FLIGHT units queued and passing each result to on_result as it lands.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Use ProcessPoolExecutor with an initializer
+    with ProcessPoolExecutor(initializer=init_worker, initargs=initargs) as executor, \
+            tqdm_asyncio(total=len(units), desc="Landcover units") as pbar:
+        unit_iter = iter(units)
+        in_flight = set()
+        while True:
+            for unit in unit_iter:
+                in_flight.add(loop.run_in_executor(executor, worker, unit, *args))
+                if len(in_flight) >= MAX_IN_FLIGHT:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for f in done:
+                on_result(f.result())
+            pbar.update(len(done))
+
+
+def _plan_units_for(raster_path, ids, bboxes):
+    """Pixel windows + block-aligned work units for bboxes on a raster."""
+    with open_landcover(raster_path) as src:
+        windows, overlap = bbox_windows(bboxes, src.crs, src.transform, src.width, src.height)
+        block_shape = src.block_shapes[0]
+
+    units = plan_work_units(ids[overlap], windows[overlap], bboxes[overlap], block_shape)
+    print(f"🧱 Grouped {int(overlap.sum())} bboxes into {len(units)} block-aligned work units")
+    return units, overlap
+
+
+async def _write_landcover_stats(con, ids, bboxes, landcover_tiff_path, decimation=1, replace=False,
+                                 label_store_path=None):
+    """
+    Compute stats for bboxes and stream them into landcover_stats.
+
+    At most MAX_IN_FLIGHT work units are queued at once, and finished batches
+    are flushed every FLUSH_ROWS rows, so memory stays bounded and an
+    interrupted run keeps everything flushed so far. With replace=True existing
+    rows for the same ids are deleted in the same flush. With a label store,
+    exact reads also write each bbox's label patch from the same window.
+    """
+    units, overlap = _plan_units_for(landcover_tiff_path, ids, bboxes)
+
+    inserter = _BatchInserter(con, "landcover_stats", replace=replace)
+    if not overlap.all():
+        inserter.add(_empty_batch(ids[~overlap]))
+
+    await _map_units(
+        units, process_unit_mp, (landcover_tiff_path, label_store_path), inserter.add, decimation
+    )
+    inserter.flush()
+    return inserter.n_written
+
+
+def overview_decimation(landcover_tiff_path, overview_level=0):
+    """Decimation factor of an internal overview level, or 2 ** (level + 1) if the file has none."""
+    with open_landcover(landcover_tiff_path) as src:
+        overviews = src.overviews(1)
+    if overview_level < len(overviews):
+        return overviews[overview_level]
+    return 2 ** (overview_level + 1)
 
 
 async def update_landcover_from_tiff(
         con,
-        landcover_tiff_path="./data/inputs/landcover-2020-classification.tif"
+        landcover_tiff_path="./data/inputs/landcover-2020-classification.tif",
+        approximate=False,
+        overview_level=0,
+        label_store_path=None,
+        label_size=256,
+):
+    """
+    Compute landcover stats for bboxes that have none yet.
+
+    approximate=True reads at the decimation of the given overview level and
+    records `decimation` and an estimated `approx_error` per row (see
+    _stats_batch); follow up with refine_landcover_stats on the bboxes that
+    survive filtering.
+
+    label_store_path (exact mode only) also writes a label_size x label_size
+    uint8 label patch per bbox, co-registered with its tile grid, into a packed
+    .npy store indexed by bbox id. In approximate mode, pass it to
+    refine_landcover_stats instead.
+    """
+    if approximate and label_store_path:
+        raise ValueError(
+            "Label patches need exact reads; pass label_store_path to refine_landcover_stats "
+            "or use approximate=False"
+        )
+    loop = asyncio.get_running_loop()
+    # Only rows without stats yet, so an interrupted run can resume
+    ids, bboxes = await loop.run_in_executor(None, _fetch_bboxes, con, """
+        SELECT b.id, b.bbox
+        FROM canada_bboxes b
+        LEFT JOIN landcover_stats l ON b.id = l.id
+        WHERE l.id IS NULL AND b.bbox IS NOT NULL
+    """)
+    print(f"🌍 Retrieved {len(ids)} rows for landcover stats")
+    if len(ids) == 0:
+        return
+
+    decimation = overview_decimation(landcover_tiff_path, overview_level) if approximate else 1
+    if decimation > 1:
+        print(f"🔎 Approximate mode: reading at 1/{decimation} resolution")
+
+    if label_store_path:
+        n_slots = con.execute("SELECT MAX(id) + 1 FROM canada_bboxes").fetchone()[0]
+        open_label_store(label_store_path, n_slots, label_size)
+
+    n_written = await _write_landcover_stats(
+        con, ids, bboxes, landcover_tiff_path, decimation, label_store_path=label_store_path
+    )
+    print(f"✅ Wrote landcover stats for {n_written} rows")
+
+
+async def refine_landcover_stats(
+        con,
+        where="l.total_count > 0",
+        landcover_tiff_path="./data/inputs/landcover-2020-classification.tif",
+        label_store_path=None,
+        label_size=256,
 ):
+    """
+    Exact pass over approximate rows matching `where` (SQL over landcover_stats `l`
+    and canada_bboxes `b`); their stats are replaced with full-resolution counts,
+    and label patches are written for them if a label store is given.
+    """
     loop = asyncio.get_running_loop()
-    rows = await loop.run_in_executor(
-        None, lambda: con.execute("SELECT id, bbox FROM canada_bboxes").fetchall()
+    ids, bboxes = await loop.run_in_executor(None, _fetch_bboxes, con, f"""
+        SELECT b.id, b.bbox
+        FROM canada_bboxes b
+        JOIN landcover_stats l ON b.id = l.id
+        WHERE l.decimation > 1 AND ({where})
+    """)
+    print(f"🌍 Refining {len(ids)} approximate landcover rows")
+    if len(ids) == 0:
+        return
+
+    if label_store_path:
+        n_slots = con.execute("SELECT MAX(id) + 1 FROM canada_bboxes").fetchone()[0]
+        open_label_store(label_store_path, n_slots, label_size)
+
+    n_written = await _write_landcover_stats(
+        con, ids, bboxes, landcover_tiff_path, replace=True, label_store_path=label_store_path
     )
-    print(f"🌍 Retrieved {len(rows)} rows for landcover stats")
+    print(f"✅ Refined landcover stats for {n_written} rows")
+
+
+# -----------------------------
+# Multi-epoch stacks
+# -----------------------------
+EPOCH_TIFFS = {
+    "2010": "./data/inputs/landcover-2010-classification.tif",
+    "2015": "./data/inputs/landcover-2015-classification.tif",
+    "2020": "./data/inputs/landcover-2020-classification.tif",
+}
+EPOCH_VRT_PATH = "./data/inputs/landcover-epochs.vrt"
+_GDAL_TYPES = {"uint8": "Byte", "int8": "Int8", "uint16": "UInt16", "int16": "Int16"}
+
+
+def create_landcover_epoch_tables(con):
+    class_cols = ", ".join([f"class_{i} BIGINT" for i in range(1, NUM_CLASSES+1)])
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS landcover_epoch_stats (
+            id INTEGER,
+            epoch TEXT,
+            nodata BIGINT,
+            total_count BIGINT,
+            {class_cols},
+            entropy DOUBLE,
+            PRIMARY KEY (id, epoch)
+        )
+    """)
+    # sparse change matrix between consecutive epochs (class 0 is nodata)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS landcover_transitions (
+            id INTEGER,
+            from_epoch TEXT,
+            to_epoch TEXT,
+            from_class SMALLINT,
+            to_class SMALLINT,
+            count BIGINT
+        )
+    """)
+
+
+def build_epoch_vrt(epoch_tiffs, vrt_path=EPOCH_VRT_PATH):
+    """
+    Stack aligned single-band rasters into a VRT with one band per epoch
+    (band description = epoch name), so all epochs come back from one read.
+    """
+    epochs = list(epoch_tiffs)
+    with rasterio.open(epoch_tiffs[epochs[0]]) as ref:
+        width, height = ref.width, ref.height
+        transform, crs = ref.transform, ref.crs
+        dtype = ref.dtypes[0]
+        block_h, block_w = ref.block_shapes[0]
+
+    bands = []
+    for i, epoch in enumerate(epochs, start=1):
+        path = os.path.abspath(epoch_tiffs[epoch])
+        with rasterio.open(path) as src:
+            if (src.width, src.height, src.transform, src.crs) != (width, height, transform, crs):
+                raise ValueError(f"{path} is not aligned with {epoch_tiffs[epochs[0]]}")
+        bands.append(f"""  <VRTRasterBand dataType="{_GDAL_TYPES[dtype]}" band="{i}">
+    <Description>{escape(epoch)}</Description>
+    <SimpleSource>
+      <SourceFilename relativeToVRT="0">{escape(path)}</SourceFilename>
+      <SourceBand>1</SourceBand>
+      <SourceProperties RasterXSize="{width}" RasterYSize="{height}" DataType="{_GDAL_TYPES[dtype]}" BlockXSize="{block_w}" BlockYSize="{block_h}"/>
+      <SrcRect xOff="0" yOff="0" xSize="{width}" ySize="{height}"/>
+      <DstRect xOff="0" yOff="0" xSize="{width}" ySize="{height}"/>
+    </SimpleSource>
+  </VRTRasterBand>""")
+
+    geotransform = ", ".join(repr(v) for v in transform.to_gdal())
+    with open(vrt_path, "w") as f:
+        f.write(f"""<VRTDataset rasterXSize="{width}" rasterYSize="{height}">
+  <SRS>{escape(crs.to_wkt())}</SRS>
+  <GeoTransform>{geotransform}</GeoTransform>
+{chr(10).join(bands)}
+</VRTDataset>
+""")
+    return vrt_path
+
+
+def _transitions_table(ids, before, after, from_epoch, to_epoch):
+    """Sparse per-bbox class transition counts between two epochs' crops."""
+    n_bins = NUM_CLASSES + 2
+    codes = [
+        (np.minimum(a.ravel(), NUM_CLASSES + 1).astype(np.int64) * n_bins
+         + np.minimum(b.ravel(), NUM_CLASSES + 1) + i * n_bins * n_bins)
+        for i, (a, b) in enumerate(zip(before, after))
+    ]
+    counts = np.bincount(np.concatenate(codes), minlength=len(ids) * n_bins * n_bins)
+    counts = counts.reshape(len(ids), n_bins, n_bins)[:, :NUM_CLASSES + 1, :NUM_CLASSES + 1]
+
+    bbox_idx, from_class, to_class = np.nonzero(counts)
+    n = len(bbox_idx)
+    return pa.table({
+        "id": pa.array(np.asarray(ids, dtype=np.int32)[bbox_idx]),
+        "from_epoch": pa.array([from_epoch] * n, type=pa.string()),
+        "to_epoch": pa.array([to_epoch] * n, type=pa.string()),
+        "from_class": pa.array(from_class.astype(np.int16)),
+        "to_class": pa.array(to_class.astype(np.int16)),
+        "count": pa.array(counts[bbox_idx, from_class, to_class].astype(np.int64)),
+    })
+
+
+def _epoch_stats_table(ids, counts_bin, epoch, total_count=None):
+    table = pa.Table.from_batches([_stats_batch(ids, counts_bin, total_count=total_count)])
+    table = table.drop_columns(["decimation", "approx_error"])
+    return table.append_column("epoch", pa.array([epoch] * len(ids), type=pa.string()))
 
-    # Use ProcessPoolExecutor with an initializer
-    with ProcessPoolExecutor(initializer=init_worker, initargs=(landcover_tiff_path,)) as executor:
-        futures = [
-            loop.run_in_executor(executor, process_row_mp, row) for row in rows
-        ]
-        results = [
-            await f
-            for f in tqdm_asyncio.as_completed(
-                futures, total=len(futures), desc="Landcover crops"
-            )
-        ]
-        
-    # Build PyArrow Table and bulk insert
-    table_dict = {
-        "id": [r["id"] for r in results],
-        "nodata": [r["nodata"] for r in results],
-        "total_count": [r["total_count"] for r in results],
-        "entropy": [r["entropy"] for r in results],
-    }
-    for i in range(NUM_CLASSES):
-        table_dict[f"class_{i+1}"] = [r["counts"][i] for r in results]
 
-    arrow_table = pa.Table.from_pydict(table_dict)
+def process_epoch_unit_mp(unit, epochs):
+    """
+    Worker function: one multi-band read of a work unit's union window, then
+    per-epoch histograms and consecutive-epoch change matrices for every bbox.
+    """
+    ids, windows, _ = unit
+    r0, c0 = windows[:, 0].min(), windows[:, 1].min()
+    r1 = (windows[:, 0] + windows[:, 2]).max()
+    c1 = (windows[:, 1] + windows[:, 3]).max()
 
-    con.register("landcover_view", arrow_table)
+    data = RASTER_SRC.read(window=Window(c0, r0, c1 - c0, r1 - r0))  # (epochs, h, w)
+
+    crops = [
+        [band[row_off - r0:row_off - r0 + height, col_off - c0:col_off - c0 + width]
+         for row_off, col_off, height, width in windows]
+        for band in data
+    ]
+    stats = pa.concat_tables([
+        _epoch_stats_table(ids, _histograms(epoch_crops), epoch)
+        for epoch, epoch_crops in zip(epochs, crops)
+    ])
+    transitions = pa.concat_tables([
+        _transitions_table(ids, crops[e], crops[e + 1], epochs[e], epochs[e + 1])
+        for e in range(len(epochs) - 1)
+    ]) if len(epochs) > 1 else None
+    return stats, transitions
+
+
+async def update_landcover_epochs(con, epoch_tiffs=EPOCH_TIFFS, vrt_path=EPOCH_VRT_PATH):
+    """
+    Per-epoch landcover stats and class transitions for bboxes without them yet.
+
+    epoch_tiffs ({epoch: path} of aligned rasters) is stacked into a VRT at
+    vrt_path; pass epoch_tiffs=None to use an existing VRT whose band
+    descriptions name the epochs.
+    """
+    loop = asyncio.get_running_loop()
+    create_landcover_epoch_tables(con)
+
+    if epoch_tiffs is not None:
+        build_epoch_vrt(epoch_tiffs, vrt_path)
+    with rasterio.open(vrt_path) as src:
+        epochs = [d or str(i) for i, d in enumerate(src.descriptions, start=1)]
+
+    # drop transitions left behind by an interrupted run, then resume
     con.execute("""
-        INSERT INTO landcover_stats
-        SELECT * FROM landcover_view
+        DELETE FROM landcover_transitions
+        WHERE id NOT IN (SELECT id FROM landcover_epoch_stats)
     """)
-    print(f"✅ Wrote landcover stats for {len(results)} rows")
+    ids, bboxes = await loop.run_in_executor(None, _fetch_bboxes, con, """
+        SELECT b.id, b.bbox
+        FROM canada_bboxes b
+        WHERE b.bbox IS NOT NULL
+          AND b.id NOT IN (SELECT id FROM landcover_epoch_stats)
+    """)
+    print(f"🌍 Retrieved {len(ids)} rows for {len(epochs)}-epoch landcover stats")
+    if len(ids) == 0:
+        return
+
+    units, overlap = _plan_units_for(vrt_path, ids, bboxes)
+
+    transitions = _BatchInserter(con, "landcover_transitions")
+    stats = _BatchInserter(con, "landcover_epoch_stats", before_flush=transitions.flush)
+
+    off_raster = ids[~overlap]
+    for epoch in epochs:
+        stats.add(_epoch_stats_table(
+            off_raster, np.zeros((len(off_raster), NUM_CLASSES + 1), dtype=np.int64), epoch,
+            total_count=np.full(len(off_raster), -1),
+        ))
+
+    def on_result(result):
+        unit_stats, unit_transitions = result
+        if unit_transitions is not None:
+            transitions.add(unit_transitions)
+        stats.add(unit_stats)
+
+    await _map_units(units, process_epoch_unit_mp, (vrt_path,), on_result, epochs)
+    stats.flush()
+    print(f"✅ Wrote {stats.n_written} epoch stats rows and {transitions.n_written} transition rows")
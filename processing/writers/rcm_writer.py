@@ -1,87 +1,500 @@
+import os
+import json
+import math
 import asyncio
 import aiohttp
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
+import geopandas as gpd
+import shapely
+from shapely.geometry import shape
+from collections import defaultdict
 from tqdm.asyncio import tqdm as tqdm_asyncio
+from processing.utils.stac_utils import AdaptiveLimiter, StacClient, StacError
 
 # Configuration
+STAC_SEARCH_URL = "https://www.eodms-sgdot.nrcan-rncan.gc.ca/stac/search"
+INITIAL_CONCURRENT_REQUESTS = 8
 MAX_CONCURRENT_REQUESTS = 50
 REQUEST_TIMEOUT = 30
+COALESCE_QUERIES = True
+COALESCE_CELL_DEG = 1.0  # grid cell size for coalesced searches
+REQUIRE_CONTAINMENT = True  # only assign items whose footprint fully contains the bbox
+STAC_ITEMS_URL = "https://www.eodms-sgdot.nrcan-rncan.gc.ca/stac/collections/rcm-ard/items"
+CATALOG_TABLE = "rcm_ard_catalog"
+CATALOG_GEOPARQUET = "./data/inputs/rcm_ard_catalog.parquet"
+USE_CATALOG = False  # match bboxes against the harvested catalog instead of searching
+SEARCH_START = "2019-06-12T00:00:00Z"
+SEARCH_END = "2048-01-01T23:59:59Z"
+STREAM_IN_FLIGHT = 256  # work units (bboxes or cells) being fetched at once
+STREAM_FLUSH_ROWS = 5000  # bbox results per Arrow write batch
+
+# Normalized layout: one row per item in the rcm_items dimension, one row per
+# (bbox, item) match in the rcm_ard_bbox_items bridge, and rcm_ard_queried
+# marking bboxes that were searched (including those with no matches).
+SCHEMA_DDL = [
+    "CREATE SEQUENCE IF NOT EXISTS rcm_item_key_seq;",
+    """
+    CREATE TABLE IF NOT EXISTS rcm_items (
+        item_key INTEGER PRIMARY KEY DEFAULT nextval('rcm_item_key_seq'),
+        item TEXT UNIQUE,
+        datetime TEXT,
+        order_key TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rcm_ard_bbox_items (
+        bbox_id INTEGER,
+        item_key INTEGER,
+        PRIMARY KEY (bbox_id, item_key)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS rcm_ard_bbox_items_item_idx ON rcm_ard_bbox_items (item_key);",
+    """
+    CREATE TABLE IF NOT EXISTS rcm_ard_queried (
+        id INTEGER PRIMARY KEY,
+        queried_at TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rcm_ard_errors (
+        id INTEGER PRIMARY KEY,
+        error TEXT,
+        attempts INTEGER,
+        last_attempt TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rcm_ard_sync (
+        source TEXT PRIMARY KEY,
+        high_water TEXT,
+        refreshed_at TIMESTAMP
+    );
+    """,
+]
+
+# created after the migration, which may still need the pre-bridge versions
+POST_MIGRATION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS rcm_ard_crop_queue (
+        id INTEGER,
+        item_key INTEGER,
+        PRIMARY KEY (id, item_key)
+    );
+    """,
+    # read-only views with the old shapes for ad-hoc queries and visualizers
+    """
+    CREATE OR REPLACE VIEW rcm_ard_items AS
+    SELECT q.id,
+           coalesce(list(i.item ORDER BY i.item_key) FILTER (WHERE i.item IS NOT NULL), []) AS items
+    FROM rcm_ard_queried AS q
+    LEFT JOIN rcm_ard_bbox_items AS b ON q.id = b.bbox_id
+    LEFT JOIN rcm_items AS i ON b.item_key = i.item_key
+    GROUP BY q.id;
+    """,
+    """
+    CREATE OR REPLACE VIEW rcm_ard_properties AS
+    SELECT item, datetime, order_key FROM rcm_items;
+    """,
+]
+
+PAIRS_SCHEMA = pa.schema([("id", pa.int32()), ("item", pa.string())])
+PROPS_SCHEMA = pa.schema([("item", pa.string()), ("datetime", pa.string()), ("order_key", pa.string())])
+
+
+def _table_columns(con, table):
+    """Column names of a base table, or an empty set if it is missing or a view."""
+    rows = con.execute("""
+        SELECT c.column_name
+        FROM information_schema.columns AS c
+        JOIN information_schema.tables AS t
+            ON c.table_name = t.table_name AND c.table_schema = t.table_schema
+        WHERE c.table_name = ? AND t.table_type = 'BASE TABLE';
+    """, [table]).fetchall()
+    return {r[0] for r in rows}
+
+
+def migrate_item_lists(con):
+    """Move TEXT[]-based rcm_ard_items / rcm_ard_properties into the normalized tables."""
+    if "items" not in _table_columns(con, "rcm_ard_items"):
+        return
+    has_props = bool(_table_columns(con, "rcm_ard_properties"))
+    print("🔁 Migrating 'rcm_ard_items' lists to 'rcm_items' / 'rcm_ard_bbox_items'")
+
+    con.execute("BEGIN TRANSACTION;")
+    props_source = (
+        "SELECT item, datetime, order_key FROM rcm_ard_properties" if has_props
+        else "SELECT NULL::TEXT AS item, NULL::TEXT AS datetime, NULL::TEXT AS order_key WHERE FALSE"
+    )
+    con.execute(f"""
+        INSERT INTO rcm_items (item, datetime, order_key)
+        SELECT u.item, p.datetime, p.order_key
+        FROM (
+            SELECT item FROM ({props_source})
+            UNION
+            SELECT DISTINCT unnest(items) AS item FROM rcm_ard_items
+        ) AS u
+        LEFT JOIN ({props_source}) AS p ON u.item = p.item
+        ON CONFLICT (item) DO NOTHING;
+    """)
+    con.execute("""
+        INSERT INTO rcm_ard_bbox_items
+        SELECT DISTINCT r.id, k.item_key
+        FROM (SELECT id, unnest(items) AS item FROM rcm_ard_items) AS r
+        JOIN rcm_items AS k ON r.item = k.item
+        ON CONFLICT DO NOTHING;
+    """)
+    con.execute("""
+        INSERT INTO rcm_ard_queried
+        SELECT id, now() FROM rcm_ard_items
+        ON CONFLICT DO NOTHING;
+    """)
+    if "item" in _table_columns(con, "rcm_ard_crop_queue"):
+        # queue rows written before the bridge held item ids as text
+        queued = con.execute("""
+            SELECT q.id, k.item_key FROM rcm_ard_crop_queue AS q
+            JOIN rcm_items AS k ON q.item = k.item
+        """).fetch_arrow_table()
+        con.execute("DROP TABLE rcm_ard_crop_queue;")
+        con.execute(POST_MIGRATION_DDL[0])
+        con.register("queued_view", queued)
+        con.execute("INSERT INTO rcm_ard_crop_queue SELECT * FROM queued_view;")
+        con.unregister("queued_view")
+    con.execute("DROP TABLE rcm_ard_items;")
+    if has_props:
+        con.execute("DROP TABLE rcm_ard_properties;")
+    con.execute("COMMIT;")
+
+    n_items, n_pairs = con.execute(
+        "SELECT (SELECT COUNT(*) FROM rcm_items), (SELECT COUNT(*) FROM rcm_ard_bbox_items)"
+    ).fetchone()
+    print(f"✅ Migrated {n_pairs} bbox-item pairs over {n_items} items.")
+
 
 async def create_rcm_ard_tables(con):
-    """Creates or replaces rcm_ard_items and ensures rcm_ard_properties exists."""
+    """Ensures the normalized RCM item tables exist, migrating the old list layout if present."""
     loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None,
-        lambda: con.execute("""
-            CREATE OR REPLACE TABLE rcm_ard_items (
-                id INTEGER PRIMARY KEY,
-                items TEXT[]
-            );
-        """)
-    )
-    await loop.run_in_executor(
-        None,
-        lambda: con.execute("""
-            CREATE TABLE IF NOT EXISTS rcm_ard_properties (
-                item TEXT PRIMARY KEY,
-                datetime TEXT,
-                order_key TEXT
-            );
+    for ddl in SCHEMA_DDL:
+        await loop.run_in_executor(None, con.execute, ddl)
+    await loop.run_in_executor(None, migrate_item_lists, con)
+    for ddl in POST_MIGRATION_DDL:
+        await loop.run_in_executor(None, con.execute, ddl)
+    print("✅ Tables 'rcm_items', 'rcm_ard_bbox_items', 'rcm_ard_queried', 'rcm_ard_errors', "
+          "'rcm_ard_sync' and 'rcm_ard_crop_queue' ready.")
+
+
+def _record_errors(con, failed, succeeded_ids):
+    """Upsert per-bbox error state and clear it for rows that succeeded."""
+    if failed:
+        errors_table = pa.Table.from_pydict({
+            "id": [r["id"] for r in failed],
+            "error": [r["error"] for r in failed],
+        })
+        con.register("errors_view", errors_table)
+        con.execute("""
+            INSERT INTO rcm_ard_errors
+            SELECT id, error, 1, now() FROM errors_view
+            ON CONFLICT (id) DO UPDATE SET
+                error = excluded.error,
+                attempts = rcm_ard_errors.attempts + 1,
+                last_attempt = excluded.last_attempt;
         """)
+        con.unregister("errors_view")
+    if succeeded_ids:
+        con.register("ok_view", pa.Table.from_pydict({"id": succeeded_ids}))
+        con.execute("DELETE FROM rcm_ard_errors WHERE id IN (SELECT id FROM ok_view);")
+        con.unregister("ok_view")
+
+def _parse_bbox(bbox):
+    # Convert bbox to coordinate list
+    if isinstance(bbox, str):
+        return [float(x.strip()) for x in bbox.split(',')]
+    return [float(x) for x in bbox]
+
+
+def _search_params(coords, start=SEARCH_START):
+    return {
+        'collections': 'rcm-ard',
+        'bbox': ','.join(map(str, coords)),
+        'datetime': f'{start}/{SEARCH_END}',
+        'limit': 1000
+    }
+
+
+def _feature_properties(f):
+    return {
+        "item": f["id"],
+        "datetime": f.get("properties", {}).get("datetime"),
+        "order_key": f.get("properties", {}).get("order_key")
+    }
+
+
+async def fetch_rcm_items(client: StacClient, row_id: int, bbox, start=SEARCH_START):
+    """Fetch RCM items and properties for a single bbox (all result pages)."""
+    coords = _parse_bbox(bbox)
+    try:
+        features = await client.search(_search_params(coords, start))
+    except StacError as e:
+        # recorded and retried on the next run instead of stored as "no items"
+        return {"id": row_id, "rcm_items": [], "properties": [], "error": str(e)}
+
+    # the API matches on intersection; apply the same predicate as the coalesced path
+    idx = assign_items_to_bboxes(features, [coords])[0]
+    feature_ids = [features[i]['id'] for i in idx]
+    # Collect feature property info
+    properties = [_feature_properties(features[i]) for i in idx]
+    return {"id": row_id, "rcm_items": feature_ids, "properties": properties, "error": None}
+
+
+def plan_query_cells(rows, cell_deg=COALESCE_CELL_DEG):
+    """
+    Group (id, bbox) rows into grid cells by bbox centre.
+
+    Returns:
+        list of (envelope, rows) where envelope is the union of the member bboxes
+    """
+    cells = defaultdict(list)
+    for row_id, bbox in rows:
+        coords = _parse_bbox(bbox)
+        key = (
+            math.floor((coords[0] + coords[2]) / 2 / cell_deg),
+            math.floor((coords[1] + coords[3]) / 2 / cell_deg),
+        )
+        cells[key].append((row_id, coords))
+
+    planned = []
+    for members in cells.values():
+        bboxes = np.array([coords for _, coords in members])
+        envelope = [bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max()]
+        planned.append((envelope, members))
+    return planned
+
+
+def assign_items_to_bboxes(features, bboxes, require_containment=None):
+    """
+    Match bboxes to item footprints locally with an STRtree.
+
+    Returns:
+        list (per bbox) of feature indices whose footprint contains (or, without
+        require_containment, intersects) the bbox
+    """
+    if require_containment is None:
+        require_containment = REQUIRE_CONTAINMENT
+    assigned = [[] for _ in bboxes]
+    with_geom = [i for i, f in enumerate(features) if f.get("geometry")]
+    if not with_geom:
+        return assigned
+
+    footprints = np.array([shape(features[i]["geometry"]) for i in with_geom])
+    tree = shapely.STRtree(footprints)
+    boxes = shapely.box(*np.asarray(bboxes, dtype=np.float64).T)
+    predicate = "within" if require_containment else "intersects"
+    bbox_idx, geom_idx = tree.query(boxes, predicate=predicate)
+    for b, g in zip(bbox_idx, geom_idx):
+        assigned[b].append(with_geom[g])
+    return assigned
+
+
+async def fetch_rcm_items_coalesced(client: StacClient, envelope, members, start=SEARCH_START):
+    """One paginated search over a cell envelope, assigned back to each member bbox."""
+    try:
+        features = await client.search(_search_params(envelope, start))
+    except StacError as e:
+        return [
+            {"id": row_id, "rcm_items": [], "properties": [], "error": str(e)}
+            for row_id, _ in members
+        ]
+
+    assigned = assign_items_to_bboxes(features, [coords for _, coords in members])
+    return [
+        {
+            "id": row_id,
+            "rcm_items": [features[i]["id"] for i in idx],
+            "properties": [_feature_properties(features[i]) for i in idx],
+            "error": None,
+        }
+        for (row_id, _), idx in zip(members, assigned)
+    ]
+
+
+def _results_tables(results):
+    """(id, item) pairs and item properties of successful results as Arrow tables."""
+    pairs = pa.Table.from_pydict({
+        "id": [r["id"] for r in results for _ in r["rcm_items"]],
+        "item": [item for r in results for item in r["rcm_items"]],
+    }, schema=PAIRS_SCHEMA)
+    props = pa.Table.from_pylist(
+        [p for r in results for p in r["properties"]], schema=PROPS_SCHEMA
     )
-    print("✅ Tables 'rcm_ard_items' and 'rcm_ard_properties' ready.")
+    return pairs, props
+
+
+def _upsert_items(con, props):
+    """Add unseen items to the rcm_items dimension."""
+    con.register("props_view", props)
+    con.execute("""
+        INSERT INTO rcm_items (item, datetime, order_key)
+        SELECT DISTINCT ON (item) item, datetime, order_key FROM props_view
+        ON CONFLICT (item) DO NOTHING;
+    """)
+    con.unregister("props_view")
+
+
+def _insert_bbox_items(con, pairs):
+    """
+    Insert (id, item) pairs into the bridge.
+
+    Returns:
+        Arrow table of the (bbox_id, item_key) pairs that were not there before
+    """
+    con.register("pairs_view", pairs)
+    new_pairs = con.execute("""
+        SELECT DISTINCT p.id AS bbox_id, k.item_key
+        FROM pairs_view AS p
+        JOIN rcm_items AS k ON p.item = k.item
+        WHERE NOT EXISTS (
+            SELECT 1 FROM rcm_ard_bbox_items AS b
+            WHERE b.bbox_id = p.id AND b.item_key = k.item_key
+        );
+    """).fetch_arrow_table()
+    con.unregister("pairs_view")
+
+    con.register("new_pairs_view", new_pairs)
+    con.execute("INSERT INTO rcm_ard_bbox_items SELECT bbox_id, item_key FROM new_pairs_view;")
+    con.unregister("new_pairs_view")
+    return new_pairs
+
+
+def _mark_queried(con, ids):
+    con.register("queried_view", pa.Table.from_pydict({"id": pa.array(ids, type=pa.int32())}))
+    con.execute("""
+        INSERT INTO rcm_ard_queried
+        SELECT id, now() FROM queried_view
+        ON CONFLICT (id) DO UPDATE SET queried_at = excluded.queried_at;
+    """)
+    con.unregister("queried_view")
+
+
+def _write_results(con, results):
+    """
+    Record failures and store successful rows in rcm_items / rcm_ard_bbox_items.
+
+    Returns:
+        (rows stored, rows failed, new bbox-item pairs)
+    """
+    # Record failures; those rows stay unqueried so the next run retries them
+    failed = [r for r in results if r["error"] is not None]
+    results = [r for r in results if r["error"] is None]
+    _record_errors(con, failed, [r["id"] for r in results])
+    if not results:
+        return 0, len(failed), 0
+
+    pairs, props = _results_tables(results)
+    _upsert_items(con, props)
+    new_pairs = _insert_bbox_items(con, pairs)
+    _mark_queried(con, [r["id"] for r in results])
+    return len(results), len(failed), new_pairs.num_rows
+
+
+async def _stream_results(con, rows, coalesce, write, start=SEARCH_START):
+    """
+    Search every (id, bbox) row, per bbox or per coalesced cell, as a bounded
+    producer/consumer stream.
+
+    At most STREAM_IN_FLIGHT units are fetched or waiting to be written at any
+    time; results are handed to write(con, results) in batches of
+    STREAM_FLUSH_ROWS rows as they arrive, so a crash only loses the open batch.
+
+    Returns:
+        column-wise sums of the tuples returned by write
+    """
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveLimiter(initial=INITIAL_CONCURRENT_REQUESTS, maximum=MAX_CONCURRENT_REQUESTS)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS * 2)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    totals = None
+
+    def add_totals(counts):
+        nonlocal totals
+        totals = counts if totals is None else tuple(a + b for a, b in zip(totals, counts))
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        client = StacClient(session, STAC_SEARCH_URL, limiter)
+        if coalesce:
+            units = plan_query_cells(rows)
+            print(f"🗺️ Coalesced {len(rows)} bboxes into {len(units)} cell queries")
+
+            def fetch(unit):
+                return fetch_rcm_items_coalesced(client, *unit, start)
+        else:
+            units = rows
+
+            async def fetch(unit):
+                return [await fetch_rcm_items(client, unit[0], unit[1], start)]
 
-async def fetch_rcm_items(session: aiohttp.ClientSession, row_id: int, bbox, semaphore: asyncio.Semaphore):
-    """Fetch RCM items and properties for a single bbox."""
-    async with semaphore:
+        work = iter(units)
+        results_queue = asyncio.Queue(maxsize=STREAM_IN_FLIGHT)
+
+        async def worker():
+            # workers share one iterator, so each unit is fetched exactly once
+            for unit in work:
+                await results_queue.put(await fetch(unit))
+
+        async def produce():
+            try:
+                await asyncio.gather(*(worker() for _ in range(min(STREAM_IN_FLIGHT, len(units)))))
+            finally:
+                await results_queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        buffer = []
         try:
-            # Convert bbox to coordinate list
-            if isinstance(bbox, str):
-                coords = [float(x.strip()) for x in bbox.split(',')]
-            else:
-                coords = [float(x) for x in bbox]
-            
-            # Build request parameters
-            params = {
-                'collections': 'rcm-ard',
-                'bbox': ','.join(map(str, coords)),
-                'datetime': '2019-06-12T00:00:00Z/2048-01-01T23:59:59Z',
-                'limit': 1000
-            }
-            
-            url = "https://www.eodms-sgdot.nrcan-rncan.gc.ca/stac/search"
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    features = data.get('features', [])
-                    feature_ids = [f['id'] for f in features]
-                    # Collect feature property info
-                    properties = [
-                        {
-                            "item": f["id"],
-                            "datetime": f.get("properties", {}).get("datetime"),
-                            "order_key": f.get("properties", {}).get("order_key")
-                        }
-                        for f in features
-                    ]
-                    return {"id": row_id, "rcm_items": feature_ids, "properties": properties}
-                else:
-                    return {"id": row_id, "rcm_items": [], "properties": []}
+            with tqdm_asyncio(total=len(units), desc="Fetching RCM items") as pbar:
+                while (unit_results := await results_queue.get()) is not None:
+                    buffer.extend(unit_results)
+                    pbar.update(1)
+                    if len(buffer) >= STREAM_FLUSH_ROWS:
+                        add_totals(await loop.run_in_executor(None, write, con, buffer))
+                        buffer = []
+                if buffer:
+                    add_totals(await loop.run_in_executor(None, write, con, buffer))
         except Exception:
-            return {"id": row_id, "rcm_items": [], "properties": []}
+            # a failed write would otherwise leave workers blocked on a full queue
+            producer.cancel()
+            raise
+        await producer
+    print(f"📈 Final concurrency limit: {int(limiter.limit)}")
+    return totals or (0, 0, 0)
 
 
-async def update_rcm_ard_tables(con):
-    """Fetch RCM items and populate both tables."""
+async def update_rcm_ard_tables(con, coalesce=COALESCE_QUERIES, use_catalog=USE_CATALOG, items_url=None):
+    """
+    Fetch RCM items and populate both tables.
+
+    With coalesce=True bboxes are grouped into COALESCE_CELL_DEG grid cells and
+    each cell is searched once; items are then matched to bboxes locally by footprint.
+    With use_catalog=True no search requests are made: bboxes are joined against
+    the harvested rcm_ard_catalog (see harvest_rcm_catalog), which is first
+    harvested from items_url (default STAC_ITEMS_URL) if missing.
+    """
     loop = asyncio.get_running_loop()
+    if use_catalog:
+        tables = await loop.run_in_executor(
+            None, lambda: {r[0] for r in con.execute("SHOW TABLES").fetchall()}
+        )
+        if CATALOG_TABLE not in tables:
+            await harvest_rcm_catalog(con, items_url=items_url)
+        await loop.run_in_executor(None, match_bboxes_from_catalog, con)
+        return
     
-    # Get rows to process
+    # Get rows to process (skipping rows already queried)
     sql_query = """
         SELECT t.id, t.bbox
         FROM canada_bboxes AS t
         JOIN landcover_stats AS l ON t.id = l.id
-        WHERE l.total_count > 0;
+        LEFT JOIN rcm_ard_queried AS r ON t.id = r.id
+        WHERE l.total_count > 0 AND r.id IS NULL;
     """
     
     rows = await loop.run_in_executor(None, lambda: con.execute(sql_query).fetchall())
@@ -91,54 +504,208 @@ async def update_rcm_ard_tables(con):
         print("✅ No rows to update.")
         return
 
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS * 2)
-    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
-    
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = [fetch_rcm_items(session, row[0], row[1], semaphore) for row in rows]
-        results = await tqdm_asyncio.gather(*tasks, desc="Fetching RCM items")
+    # rows are marked queried batch by batch, so a restart skips everything already written
+    stored, failed, pairs = await _stream_results(con, rows, coalesce, _write_results)
+    if failed:
+        print(f"⚠️ {failed} rows failed and will be retried on the next run.")
+    print(f"✅ Stored {stored} rows ({pairs} bbox-item pairs).")
+
+
+# -----------------------------
+# Incremental refresh
+# -----------------------------
+def get_high_water(con, source="search"):
+    """Latest acquisition datetime already ingested (stored mark, else newest known item)."""
+    row = con.execute("SELECT high_water FROM rcm_ard_sync WHERE source = ?", [source]).fetchone()
+    if row is not None and row[0] is not None:
+        return row[0]
+    return con.execute("SELECT MAX(datetime) FROM rcm_items").fetchone()[0]
+
+
+def _append_results(con, results):
+    """
+    Add newly found items to the bridge and queue the new (id, item) pairs in
+    rcm_ard_crop_queue.
+
+    The whole batch is one transaction: a pair that reaches the bridge is
+    always queued too, since a rerun only queues pairs new to the bridge.
+
+    Returns:
+        (rows refreshed, rows failed, new bbox-item pairs)
+    """
+    failed = [r for r in results if r["error"] is not None]
+    results = [r for r in results if r["error"] is None]
+    pairs, props = _results_tables(results)
+
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        _record_errors(con, failed, [r["id"] for r in results])
+        _upsert_items(con, props)
+        # the search interval is inclusive, so items at exactly the mark come back again
+        new_pairs = _insert_bbox_items(con, pairs)
+        con.register("new_pairs_view", new_pairs)
+        con.execute("""
+            INSERT INTO rcm_ard_crop_queue
+            SELECT bbox_id, item_key FROM new_pairs_view
+            ON CONFLICT DO NOTHING;
+        """)
+        con.unregister("new_pairs_view")
+        _mark_queried(con, [r["id"] for r in results])
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    return len(results), len(failed), new_pairs.num_rows
+
+
+def set_high_water(con, high_water, source="search"):
+    """Advance the mark to the newest ingested item (never below high_water) in one transaction."""
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        newest = con.execute("SELECT MAX(datetime) FROM rcm_items").fetchone()[0]
+        con.execute("""
+            INSERT INTO rcm_ard_sync VALUES (?, ?, now())
+            ON CONFLICT (source) DO UPDATE SET
+                high_water = excluded.high_water, refreshed_at = excluded.refreshed_at;
+        """, [source, max(high_water, newest or high_water)])
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+
+
+async def refresh_rcm_ard_tables(con, coalesce=COALESCE_QUERIES):
+    """
+    Query only acquisitions newer than the stored high-water mark for bboxes
+    already queried, and append what is new.
+    """
+    loop = asyncio.get_running_loop()
+    high_water = await loop.run_in_executor(None, get_high_water, con)
+    if high_water is None:
+        print("ℹ️ No high-water mark yet; running a full update.")
+        await update_rcm_ard_tables(con, coalesce=coalesce)
+        return
+
+    rows = await loop.run_in_executor(None, lambda: con.execute("""
+        SELECT t.id, t.bbox
+        FROM canada_bboxes AS t
+        JOIN rcm_ard_queried AS r ON t.id = r.id;
+    """).fetchall())
+    print(f"🔄 Refreshing {len(rows)} rows for acquisitions since {high_water}")
+    if not rows:
+        return
+
+    _, failed, pairs = await _stream_results(con, rows, coalesce, _append_results, start=high_water)
 
-    # Insert into rcm_ard_items
-    arrow_table = pa.Table.from_pydict({
-        "id": [r["id"] for r in results],
-        "items": [r["rcm_items"] for r in results],
+    # only advance the mark when every bbox was refreshed, or failed ones would miss items
+    if failed:
+        print(f"⚠️ {failed} rows failed; high-water mark left at {high_water}.")
+    else:
+        await loop.run_in_executor(None, set_high_water, con, high_water)
+    print(f"✅ Appended {pairs} new (bbox, item) pairs and queued them for cropping.")
+
+
+# -----------------------------
+# Offline catalog
+# -----------------------------
+def _catalog_table(features):
+    """Arrow table of item id, datetime, order_key, asset hrefs, footprint WKB and its bounds."""
+    features = [f for f in features if f.get("geometry")]
+    footprints = np.array([shape(f["geometry"]) for f in features], dtype=object)
+    bounds = shapely.bounds(footprints) if len(footprints) else np.empty((0, 4))
+    return pa.Table.from_pydict({
+        "item": [f["id"] for f in features],
+        "datetime": [f.get("properties", {}).get("datetime") for f in features],
+        "order_key": [f.get("properties", {}).get("order_key") for f in features],
+        "assets": [
+            json.dumps({k: a.get("href") for k, a in f.get("assets", {}).items()})
+            for f in features
+        ],
+        "geometry": pa.array(shapely.to_wkb(footprints).tolist(), type=pa.binary()),
+        "minx": bounds[:, 0], "miny": bounds[:, 1],
+        "maxx": bounds[:, 2], "maxy": bounds[:, 3],
     })
-    con.register("rcm_view", arrow_table)
-    await loop.run_in_executor(
-        None,
-        lambda: con.execute("INSERT INTO rcm_ard_items BY NAME SELECT * FROM rcm_view;")
-    )
-    con.unregister("rcm_view")
-
-    # Flatten unique properties for rcm_ard_properties
-    all_properties = {}
-    for r in results:
-        for p in r["properties"]:
-            if p["item"] not in all_properties:  # deduplicate
-                all_properties[p["item"]] = (p["datetime"], p["order_key"])
-
-    if all_properties:
-        items = list(all_properties.keys())
-        datetimes = [all_properties[i][0] for i in items]
-        order_keys = [all_properties[i][1] for i in items]
-
-        props_table = pa.Table.from_pydict({
-            "item": items,
-            "datetime": datetimes,
-            "order_key": order_keys
-        })
-        con.register("props_view", props_table)
-        # Insert only new ones
-        await loop.run_in_executor(
-            None,
-            lambda: con.execute("""
-                INSERT INTO rcm_ard_properties
-                SELECT * FROM props_view
-                ON CONFLICT (item) DO NOTHING;
-            """)
+
+
+async def harvest_rcm_catalog(con, items_url=None, geoparquet_path=None):
+    """
+    Page through the whole rcm-ard collection once and store it locally.
+
+    Writes the CATALOG_TABLE table (replacing any previous harvest) and a
+    GeoParquet copy at geoparquet_path. items_url and geoparquet_path default
+    to STAC_ITEMS_URL and CATALOG_GEOPARQUET; set CATALOG_GEOPARQUET = None to
+    skip the GeoParquet copy.
+    """
+    items_url = items_url or STAC_ITEMS_URL
+    geoparquet_path = geoparquet_path or CATALOG_GEOPARQUET
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveLimiter(initial=1, maximum=1)  # pages are sequential anyway
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        client = StacClient(session, items_url, limiter)
+        features = await client.get_pages(items_url, params={"limit": 1000})
+    print(f"🛰️ Harvested {len(features)} items from {items_url}")
+
+    catalog = _catalog_table(features)
+
+    def write():
+        con.register("catalog_view", catalog)
+        con.execute(f"CREATE OR REPLACE TABLE {CATALOG_TABLE} AS SELECT * FROM catalog_view;")
+        con.unregister("catalog_view")
+
+    await loop.run_in_executor(None, write)
+
+    if geoparquet_path:
+        os.makedirs(os.path.dirname(geoparquet_path), exist_ok=True)
+        gdf = gpd.GeoDataFrame(
+            catalog.drop_columns(["geometry"]).to_pandas(),
+            geometry=shapely.from_wkb(catalog["geometry"].to_numpy(zero_copy_only=False)),
+            crs="EPSG:4326",
         )
-        con.unregister("props_view")
-        print(f"✅ Added {len(items)} new properties to 'rcm_ard_properties'.")
+        await loop.run_in_executor(None, lambda: gdf.to_parquet(geoparquet_path, index=False))
+    print(f"✅ Catalog '{CATALOG_TABLE}' ready with {catalog.num_rows} items.")
+
+
+def match_bboxes_from_catalog(con, require_containment=None):
+    """
+    Fill the bbox-item bridge for every unqueried bbox with one STRtree join
+    against the local catalog, limited to SEARCH_START/SEARCH_END like a search.
+    """
+    bbox_table = con.execute("""
+        SELECT t.id, t.bbox
+        FROM canada_bboxes AS t
+        JOIN landcover_stats AS l ON t.id = l.id
+        LEFT JOIN rcm_ard_queried AS r ON t.id = r.id
+        WHERE l.total_count > 0 AND r.id IS NULL;
+    """).fetch_arrow_table()
+    print(f"🛰️ Matching {bbox_table.num_rows} rows against '{CATALOG_TABLE}'")
+    if bbox_table.num_rows == 0:
+        print("✅ No rows to update.")
+        return
+
+    catalog = con.execute(f"""
+        SELECT item, datetime, order_key, geometry FROM {CATALOG_TABLE}
+        WHERE TRY_CAST(datetime AS TIMESTAMPTZ)
+            BETWEEN CAST(? AS TIMESTAMPTZ) AND CAST(? AS TIMESTAMPTZ)
+    """, [SEARCH_START, SEARCH_END]).fetch_arrow_table()
+    footprints = shapely.from_wkb(catalog["geometry"].to_numpy(zero_copy_only=False))
+    tree = shapely.STRtree(footprints)
+
+    ids = bbox_table["id"].to_numpy()
+    coords = pc.list_flatten(bbox_table["bbox"]).to_numpy().reshape(-1, 4)
+    boxes = shapely.box(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+    if require_containment is None:
+        require_containment = REQUIRE_CONTAINMENT
+    predicate = "within" if require_containment else "intersects"
+    bbox_idx, item_idx = tree.query(boxes, predicate=predicate)
+
+    pairs = pa.Table.from_pydict({
+        "id": pa.array(ids[bbox_idx], type=pa.int32()),
+        "item": catalog["item"].take(pa.array(item_idx)),
+    }, schema=PAIRS_SCHEMA)
+    props = catalog.select(["item", "datetime", "order_key"]).take(pa.array(np.unique(item_idx)))
 
-    print(f"✅ Populated 'rcm_ard_items' with {len(results)} rows.")
+    _upsert_items(con, props)
+    new_pairs = _insert_bbox_items(con, pairs)
+    _mark_queried(con, ids)
+    print(f"✅ Stored {len(ids)} rows from the catalog ({new_pairs.num_rows} bbox-item pairs).")
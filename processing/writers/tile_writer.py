@@ -8,13 +8,16 @@ import numpy as np
 from pyproj import Transformer
 from tqdm.asyncio import tqdm
 import os
-import random
-from collections import defaultdict
+import asyncio
+import requests
+from rasterio.errors import RasterioError
+from processing.utils.cog_utils import CachedRangeOpener
 
 # --- CONFIG ---
-RCM_TABLE_SOURCE = "rcm_ard_items"
-RCM_TABLE_PROPS = "rcm_ard_properties"
+RCM_TABLE_SOURCE = "rcm_ard_bbox_items"
+RCM_TABLE_ITEMS = "rcm_items"
 RCM_TABLE_TARGET = "rcm_ard_tiles"
+RCM_TABLE_QUEUE = "rcm_ard_crop_queue"
 BBOX_TABLE = "canada_bboxes"
 OUTPUT_DIR = Path("./data/outputs/rcm_tiles")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -23,6 +26,18 @@ FILTER_CDUID = 1006
 NODATA_CUTOFF = 0.01
 ITEMS_PER_ID = 5
 CROP_SIZE = 256
+COG_BASE_URL = "https://rcm-ceos-ard.s3.ca-central-1.amazonaws.com/MLC"
+CROP_MODE = "range"  # "range": read only the needed COG blocks; "download": fetch full scenes
+USE_BLOCK_CACHE = False  # range reads through CachedRangeOpener instead of GDAL /vsicurl/
+RANGE_CONCURRENT_ITEMS = 8
+# keep GDAL from listing the bucket and merge adjacent tile requests
+VSICURL_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "VSI_CACHE": "TRUE",
+}
 # asset mappings
 BAND_MAP = {
     "rl": "RL",
@@ -35,7 +50,7 @@ async def create_rcm_ard_tiles_table(con):
     nodata_cols = ",\n".join([f"{key}_nodata_pct DOUBLE" for key in BAND_MAP.keys()])
     
     con.execute(f"""
-        CREATE OR REPLACE TABLE {RCM_TABLE_TARGET} (
+        CREATE TABLE IF NOT EXISTS {RCM_TABLE_TARGET} (
             id INTEGER,
             item TEXT,
             {nodata_cols},
@@ -55,23 +70,27 @@ async def download_file(session, url, out_path):
                 f.write(chunk)
 
 
-async def download_bands(item, datetime, order_key, session):
-    """Download RL and RR tif for one item into its own folder."""
+def band_urls(datetime, order_key, base_url=None):
+    """URL of each BAND_MAP band's GeoTIFF for one item (under COG_BASE_URL by default)."""
+    base_url = base_url or COG_BASE_URL
     date = pd.to_datetime(datetime)
     yyyy, mm, dd = date.strftime("%Y"), date.strftime("%m"), date.strftime("%d")
     base = order_key.replace("_CH_CV_MLC", "")
+    return {
+        k: f"{base_url}/{yyyy}/{mm}/{dd}/{order_key}/{base}_{band}.tif"
+        for k, band in BAND_MAP.items()
+    }
 
+
+async def download_bands(item, datetime, order_key, session):
+    """Download RL and RR tif for one item into its own folder."""
     # Create folder for this item
     item_dir = OUTPUT_DIR / item
     item_dir.mkdir(parents=True, exist_ok=True)
 
     out_files = {}
-    for k, band in BAND_MAP.items():
-        url = (
-            f"https://rcm-ceos-ard.s3.ca-central-1.amazonaws.com/MLC/"
-            f"{yyyy}/{mm}/{dd}/{order_key}/{base}_{band}.tif"
-        )
-        out_path = item_dir / f"{item}_{band}.tif"
+    for k, url in band_urls(datetime, order_key).items():
+        out_path = item_dir / f"{item}_{BAND_MAP[k]}.tif"
         if not out_path.exists():
             await download_file(session, url, out_path)
         out_files[k] = out_path
@@ -93,23 +112,65 @@ def combine_bands(band_paths: dict, out_path):
     return out_path
 
 
+def crop_window(src, lon, lat, crop_size=CROP_SIZE):
+    """crop_size x crop_size window of src centred on lon/lat."""
+    # Transform lon/lat to raster CRS
+    transformer = Transformer.from_crs("EPSG:4326", src.crs, always_xy=True)
+    x, y = transformer.transform(lon, lat)
+
+    # Convert to row/col in raster grid
+    row, col = src.index(x, y)
+
+    # Define window centered on (row, col)
+    half = crop_size // 2
+    return rasterio.windows.Window(
+        col_off=col - half,
+        row_off=row - half,
+        width=crop_size,
+        height=crop_size
+    )
+
+
+def save_crop(data, meta, nodata_val, out_path, descriptions=None):
+    """
+    Fill small nodata gaps and write a crop, unless it has too much nodata.
+
+    Returns:
+        (per-band nodata fractions, written path or None, height, width)
+    """
+    # --- Compute nodata fraction (0–1) ---
+    nodata_frac = [(np.count_nonzero(b == nodata_val) / b.size) for b in data]
+
+    # --- Check cutoff ---
+    if any(frac > NODATA_CUTOFF for frac in nodata_frac):
+        return nodata_frac, None, data.shape[1], data.shape[2]
+
+    # --- Fill nodata if below cutoff ---
+    filled_data = np.empty_like(data)
+    for i in range(data.shape[0]):  # loop over bands
+        band = data[i].astype(np.float32)
+        mask = band != nodata_val
+        filled_band = fillnodata(
+            band,
+            mask=mask.astype(np.uint8),
+            max_search_distance=100,
+            smoothing_iterations=0,
+            nodata=nodata_val
+        )
+        filled_data[i] = filled_band
+
+    # Save filled tif
+    with rasterio.open(out_path, "w", **meta) as dst:
+        dst.write(filled_data)
+        for i, desc in enumerate(descriptions or [], start=1):
+            dst.set_band_description(i, desc)
+
+    return nodata_frac, str(out_path), data.shape[1], data.shape[2]
+
+
 def crop_tiff(input_tif, lon, lat, out_path, crop_size=CROP_SIZE):
     with rasterio.open(input_tif) as src:
-        # Transform lon/lat to raster CRS
-        transformer = Transformer.from_crs("EPSG:4326", src.crs, always_xy=True)
-        x, y = transformer.transform(lon, lat)
-
-        # Convert to row/col in raster grid
-        row, col = src.index(x, y)
-
-        # Define window centered on (row, col)
-        half = crop_size // 2
-        window = rasterio.windows.Window(
-            col_off=col - half,
-            row_off=row - half,
-            width=crop_size,
-            height=crop_size
-        )
+        window = crop_window(src, lon, lat, crop_size)
 
         # Read data in window
         data = src.read(window=window, boundless=True, fill_value=src.nodata)
@@ -119,117 +180,209 @@ def crop_tiff(input_tif, lon, lat, out_path, crop_size=CROP_SIZE):
             height=crop_size,
             transform=src.window_transform(window)
         )
-
-        # --- Compute nodata fraction (0–1) ---
         nodata_val = src.nodata if src.nodata is not None else 0
-        nodata_frac = [(np.count_nonzero(b == nodata_val) / b.size) for b in data]
-
-        # --- Check cutoff ---
-        if any(frac > NODATA_CUTOFF for frac in nodata_frac):
-            return nodata_frac, None, data.shape[1], data.shape[2]
-
-        # --- Fill nodata if below cutoff ---
-        filled_data = np.empty_like(data)
-        for i in range(data.shape[0]):  # loop over bands
-            band = data[i].astype(np.float32)
-            mask = band != nodata_val
-            filled_band = fillnodata(
-                band,
-                mask=mask.astype(np.uint8),
-                max_search_distance=100,
-                smoothing_iterations=0,
-                nodata=nodata_val
-            )
-            filled_data[i] = filled_band
 
-        # Save filled tif
-        with rasterio.open(out_path, "w", **meta) as dst:
-            dst.write(filled_data)
+    return save_crop(data, meta, nodata_val, out_path)
 
-    return nodata_frac, str(out_path), data.shape[1], data.shape[2]
+
+def open_band(url, opener=None):
+    """Open a remote band COG for range reads, via the block cache or GDAL /vsicurl/."""
+    if opener is not None:
+        return rasterio.open(url, opener=opener)
+    return rasterio.open(f"/vsicurl/{url}")
 
 
-async def download_rcm_tiles(con):
+def crop_item_ranges(urls: dict, item, ids, lons, lats, crop_size=CROP_SIZE):
+    """
+    Crop every (id, lon, lat) of one item straight from its remote band COGs,
+    reading only the blocks under each window.
+
+    Returns:
+        list of (id, nodata fractions, path or None, height, width)
+    """
+    item_dir = OUTPUT_DIR / item
+    item_dir.mkdir(parents=True, exist_ok=True)
+    opener = CachedRangeOpener() if USE_BLOCK_CACHE else None
+
+    records = []
+    with rasterio.Env(**VSICURL_OPTIONS):
+        srcs = {k: open_band(url, opener) for k, url in urls.items()}
+        try:
+            first = next(iter(srcs.values()))
+            nodata_val = first.nodata if first.nodata is not None else 0
+            for row_id, lon, lat in zip(ids, lons, lats):
+                # bands of one item share a grid, so one window serves all of them
+                window = crop_window(first, lon, lat, crop_size)
+                data = np.stack([
+                    src.read(1, window=window, boundless=True, fill_value=src.nodata)
+                    for src in srcs.values()
+                ])
+                meta = first.meta.copy()
+                meta.update(
+                    driver="GTiff",
+                    count=len(srcs),
+                    width=crop_size,
+                    height=crop_size,
+                    transform=first.window_transform(window)
+                )
+                out_crop = item_dir / f"{item}_{row_id}.tif"
+                records.append((row_id, *save_crop(data, meta, nodata_val, out_crop, list(srcs))))
+        finally:
+            for src in srcs.values():
+                src.close()
+    return records
+
+
+def insert_tile_records(con, item, records):
+    # Build dynamic column/value list for nodata fractions
+    nodata_cols = [f"{key}_nodata_pct" for key in BAND_MAP.keys()]
+    con.executemany(f"""
+        INSERT INTO {RCM_TABLE_TARGET} (
+            id, item, {", ".join(nodata_cols)}, filepath, height, width
+        ) VALUES (
+            ?, ?, {", ".join(["?"] * len(nodata_cols))}, ?, ?, ?
+        )
+    """, [
+        [row_id, item, *nodata_fracs[:len(BAND_MAP)], out_path, height, width]
+        for row_id, nodata_fracs, out_path, height, width in records
+    ])
+
+
+async def crop_items_ranged(con, item_rows):
+    """
+    Range-read crops for many items at once; DB writes stay on the event loop thread.
+
+    Returns:
+        items whose range reads failed
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(RANGE_CONCURRENT_ITEMS)
+
+    async def crop_item(item, datetime, order_key, ids, lons, lats):
+        if datetime is None or order_key is None:
+            print(f"⚠️ Skipping {item}, no properties found.")
+            return
+        async with sem:
+            try:
+                records = await loop.run_in_executor(
+                    None, crop_item_ranges, band_urls(datetime, order_key), item, ids, lons, lats
+                )
+            except (RasterioError, OSError, requests.RequestException) as e:
+                # no tile rows are written, so the pairs are retried on the next run
+                print(f"⚠️ Skipping {item}, range read failed: {e}")
+                failed.append(item)
+                return
+        insert_tile_records(con, item, records)
+
+    failed = []
+    await tqdm.gather(*(crop_item(*row) for row in item_rows), desc="Cropping items (range reads)")
+    return failed
+
+
+async def download_rcm_tiles(con, queued_only=False, mode=CROP_MODE):
+    """
+    Crop sampled items for every bbox. With queued_only=True only (bbox, item)
+    pairs queued by an incremental refresh are considered.
+
+    mode="range" reads each crop window straight from the remote COGs;
+    mode="download" fetches and merges full scenes first.
+    """
     # Step 1: get unique items + their datetime & order_key
     filter_clause = ""
     if FILTER_CDUID:
         filter_clause += f"AND c.census_div_id = {FILTER_CDUID}"
     elif FILTER_PRUID:
         filter_clause += f"AND c.province_id = {FILTER_PRUID}"
-        
-    df_ids = con.execute(f"""
-        SELECT r.id, r.items
-        FROM {RCM_TABLE_SOURCE} r
-        JOIN {BBOX_TABLE} c ON r.id = c.id
-        WHERE array_length(r.items) > 0
-        {filter_clause}
-    """).df()
-
-    id_to_items = dict()
-    for row in df_ids.itertuples():
-        row_id = row.id
-        items = list(row.items)
-        if ITEMS_PER_ID is not None:
-            sampled = random.sample(items, min(ITEMS_PER_ID, len(items)))
-            id_to_items[row_id] = sampled
-        else:
-            id_to_items[row_id] = items
-    
-    item_to_ids = defaultdict(list)
-    for row_id, items in id_to_items.items():
-        for item in items:
-            item_to_ids[item].append(row_id)
-
-    # Get datetime/order_key mapping for each item
-    props = con.execute(f"SELECT item, datetime, order_key FROM {RCM_TABLE_PROPS}").df()
-    props_map = {row.item: (row.datetime, row.order_key) for row in props.itertuples()}
-
-    async with aiohttp.ClientSession() as session:
-        for item in tqdm(item_to_ids.keys(), desc="Processing items"):
-            if item not in props_map:
-                print(f"⚠️ Skipping {item}, no properties found.")
-                continue
-
-            datetime, order_key = props_map[item]
-            band_files = await download_bands(item, datetime, order_key, session)
-
-            # merged path inside item folder
-            item_dir = OUTPUT_DIR / item
-            merged_path = item_dir / f"{item}_merged.tif"
-            if not merged_path.exists():
-                combine_bands(band_files, merged_path)
-                # Remove single-band files after merge
-                for f in band_files.values():
-                    try:
-                        os.remove(f)
-                    except FileNotFoundError:
-                        pass
-
-            # Process only the IDs that sampled this item
-            for row_id in tqdm(item_to_ids[item], desc=f"Cropping {item}", leave=False):
-                lon, lat = con.execute(
-                    f"SELECT lon, lat FROM {BBOX_TABLE} WHERE id = {row_id}"
-                ).fetchone()
 
-                out_crop = item_dir / f"{item}_{row_id}.tif"
-                nodata_fracs, out_path, height, width = crop_tiff(
-                    merged_path, lon, lat, out_crop, crop_size=CROP_SIZE
-                )
-
-                # Build dynamic column/value list for nodata fractions
-                nodata_cols = [f"{key}_nodata_pct" for key in BAND_MAP.keys()]
-                nodata_vals = [nodata_fracs[i] for i in range(len(BAND_MAP))]
+    source = RCM_TABLE_QUEUE if queued_only else RCM_TABLE_SOURCE
+    id_column = "id" if queued_only else "bbox_id"
+    # deterministic per-bbox sample, so a resumed run picks the same items
+    sampled_expr = "TRUE"
+    if ITEMS_PER_ID is not None:
+        sampled_expr = (
+            f"row_number() OVER (PARTITION BY s.{id_column} "
+            f"ORDER BY hash(s.{id_column}, s.item_key)) <= {ITEMS_PER_ID}"
+        )
 
-                con.execute(f"""
-                    INSERT INTO {RCM_TABLE_TARGET} (
-                        id, item, {", ".join(nodata_cols)}, filepath, height, width
-                    ) VALUES (
-                        ?, ?, {", ".join(["?"] * len(nodata_cols))}, ?, ?, ?
-                    )
-                """, [row_id, item, *nodata_vals, out_path, height, width])
+    # every in-filter (id, item) pair, flagged with whether the sample picked it
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE crop_candidates AS
+        SELECT s.{id_column} AS id, s.item_key, c.lon, c.lat, {sampled_expr} AS sampled
+        FROM {source} s
+        JOIN {BBOX_TABLE} c ON s.{id_column} = c.id
+        WHERE TRUE
+        {filter_clause}
+    """)
 
-            # Remove merged file after all crops are done
-            try:
-                os.remove(merged_path)
-            except FileNotFoundError:
-                pass
+    # item -> (ids, lons, lats) still to crop, skipping (id, item) crops already recorded
+    item_rows = con.execute(f"""
+        SELECT i.item, i.datetime, i.order_key,
+               list(p.id ORDER BY p.id) AS ids,
+               list(p.lon ORDER BY p.id) AS lons,
+               list(p.lat ORDER BY p.id) AS lats
+        FROM crop_candidates p
+        JOIN {RCM_TABLE_ITEMS} i ON p.item_key = i.item_key
+        WHERE p.sampled AND NOT EXISTS (
+            SELECT 1 FROM {RCM_TABLE_TARGET} t WHERE t.id = p.id AND t.item = i.item
+        )
+        GROUP BY i.item, i.datetime, i.order_key
+        ORDER BY i.item
+    """).fetchall()
+
+    if mode == "range":
+        failed_items = await crop_items_ranged(con, item_rows)
+        if failed_items:
+            print(f"⚠️ {len(failed_items)} items failed and will be retried on the next run.")
+    else:
+        async with aiohttp.ClientSession() as session:
+            for item, datetime, order_key, ids, lons, lats in tqdm(item_rows, desc="Processing items"):
+                if datetime is None or order_key is None:
+                    print(f"⚠️ Skipping {item}, no properties found.")
+                    continue
+
+                band_files = await download_bands(item, datetime, order_key, session)
+
+                # merged path inside item folder
+                item_dir = OUTPUT_DIR / item
+                merged_path = item_dir / f"{item}_merged.tif"
+                if not merged_path.exists():
+                    combine_bands(band_files, merged_path)
+                    # Remove single-band files after merge
+                    for f in band_files.values():
+                        try:
+                            os.remove(f)
+                        except FileNotFoundError:
+                            pass
+
+                # Process only the IDs that sampled this item
+                for row_id, lon, lat in tqdm(
+                    list(zip(ids, lons, lats)), desc=f"Cropping {item}", leave=False
+                ):
+                    out_crop = item_dir / f"{item}_{row_id}.tif"
+                    insert_tile_records(con, item, [
+                        (row_id, *crop_tiff(merged_path, lon, lat, out_crop, crop_size=CROP_SIZE))
+                    ])
+
+                # Remove merged file after all crops are done
+                try:
+                    os.remove(merged_path)
+                except FileNotFoundError:
+                    pass
+
+    if queued_only:
+        # a queued pair is done once it is cropped, or once the sample for its
+        # bbox passed it over; pairs outside the filter, of items without
+        # properties or of failed items stay queued for a later run
+        con.execute(f"""
+            DELETE FROM {RCM_TABLE_QUEUE} q
+            WHERE EXISTS (
+                SELECT 1
+                FROM crop_candidates p
+                JOIN {RCM_TABLE_ITEMS} i ON p.item_key = i.item_key
+                WHERE p.id = q.id AND p.item_key = q.item_key
+                  AND (NOT p.sampled OR EXISTS (
+                      SELECT 1 FROM {RCM_TABLE_TARGET} t WHERE t.id = p.id AND t.item = i.item
+                  ))
+            )
+        """)
+    con.execute("DROP TABLE IF EXISTS crop_candidates")
@@ -0,0 +1,15 @@
+import rasterio
+from rasterio.transform import from_origin
+
+
+def write_cog(path, data, crs="EPSG:3979", transform=None, nodata=None):
+    """Write a tiled, single-band COG with a fixed grid."""
+    transform = transform or from_origin(0, 0, 30, 30)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(
+        path, "w", driver="COG", width=data.shape[1], height=data.shape[0], count=1,
+        dtype=data.dtype, crs=crs, transform=transform, nodata=nodata, blocksize=256,
+        resampling="NEAREST",  # categorical: overviews must keep class values
+    ) as dst:
+        dst.write(data, 1)
+    return path
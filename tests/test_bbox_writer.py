@@ -0,0 +1,68 @@
+import asyncio
+import itertools
+
+import duckdb
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from processing.utils import point_utils
+from processing.writers import bbox_writer
+from processing.writers.bbox_writer import create_bbox_table, insert_points_async
+
+
+def test_rerun_of_points_stage_does_not_add_a_second_sample():
+    con = duckdb.connect()
+    create_bbox_table(con)
+    con.execute("INSERT INTO canada_bboxes (id, lon, lat) VALUES (1, -75.0, 45.0), (2, -80.0, 50.0)")
+
+    asyncio.run(insert_points_async(con))
+
+    assert con.execute("SELECT COUNT(*), MAX(id) FROM canada_bboxes").fetchone() == (2, 2)
+
+
+def test_separated_sampling_meets_quotas_and_spacing(tmp_path, monkeypatch):
+    min_dist_m = 2000
+    monkeypatch.setattr(bbox_writer, "MIN_SEPARATION_M", min_dist_m)
+    layer = tmp_path / "layer"
+    layer.mkdir()
+    # ~8 km x 11 km boxes: first draws often collide at 2 km, so quotas need redraws
+    gpd.GeoDataFrame(
+        {"GID": ["1", "2"]},
+        geometry=[shapely.box(-75.0, 45.0, -74.9, 45.1), shapely.box(-74.9, 45.0, -74.8, 45.1)],
+        crs="EPSG:4326",
+    ).to_file(layer / "layer.shp")
+
+    rng = np.random.default_rng(0)
+
+    async def draw_geometries(deficits):
+        return await point_utils.sample_points_per_geometry(
+            str(layer), "GID", n_points_per_geom=4, n_workers=1, seed=int(rng.integers(2**31)),
+            ids=None if deficits is None else {str(key) for key in deficits},
+        )
+
+    async def draw_random(deficits):
+        n = 6 if deficits is None else sum(deficits.values())
+        return [{"lon": lon, "lat": lat, "ID": None}
+                for lon, lat in zip(rng.uniform(-75.0, -74.8, n), rng.uniform(45.1, 45.2, n))]
+
+    existing = (np.array([-74.95]), np.array([45.05]))
+    grid = point_utils.SeparationGrid(min_dist_m)
+    grid.seed(*existing)
+
+    geom_points = asyncio.run(bbox_writer._sample_separated(draw_geometries, "GID", 4, grid))
+    rand_points = asyncio.run(bbox_writer._sample_separated(draw_random, "ID", 6, grid))
+
+    counts = {}
+    for p in geom_points:
+        counts[p["GID"]] = counts.get(p["GID"], 0) + 1
+    assert counts == {"1": 4, "2": 4}
+    assert len(rand_points) == 6
+
+    points = geom_points + rand_points
+    lons = np.concatenate([[p["lon"] for p in points], existing[0]])
+    lats = np.concatenate([[p["lat"] for p in points], existing[1]])
+    xs, ys = Transformer.from_crs("EPSG:4326", point_utils.SEPARATION_CRS, always_xy=True).transform(lons, lats)
+    min_dist = min(np.hypot(xs[i] - xs[j], ys[i] - ys[j]) for i, j in itertools.combinations(range(len(xs)), 2))
+    assert min_dist >= min_dist_m
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing.utils.census_utils import CanadaHierarchy
+
+
+@pytest.mark.parametrize("values", [
+    pd.Series([10, 11, 12], dtype="int64"),
+    pd.Series([10.0, None, 12.0]),
+    pd.Series([10, None, 12], dtype="Int64"),
+    pd.Series(["10", "x", "12"]),
+])
+def test_to_int_array_returns_writable_arrays(values):
+    ids, valid = CanadaHierarchy._to_int_array(values, 3)
+    # CensusResolver.resolve fills both in place
+    ids[1], valid[1] = 99, True
+    assert ids.tolist() == [10, 99, 12]
+    assert valid.tolist() == [True, True, True]
+
+
+def test_to_int_array_none():
+    ids, valid = CanadaHierarchy._to_int_array(None, 2)
+    assert ids.dtype == np.int64 and not valid.any()
@@ -0,0 +1,72 @@
+import asyncio
+
+import duckdb
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from processing.utils.cog_utils import CachedRangeOpener
+from processing.writers.landcover_writer import create_landcover_table, open_landcover, update_landcover_from_tiff
+from tests.helpers import write_cog
+
+
+def test_cached_range_opener_reads_match_source(range_server, landcover_array, tmp_path):
+    root, base_url = range_server
+    write_cog(root / "landcover.tif", landcover_array)
+    opener = CachedRangeOpener(cache_dir=str(tmp_path / "cache"))
+
+    window = Window(100, 200, 300, 300)
+    expected = landcover_array[200:500, 100:400]
+    with rasterio.open(f"{base_url}/landcover.tif", opener=opener) as src:
+        assert (src.read(1, window=window) == expected).all()
+
+    # second open is served from the block cache
+    assert any((tmp_path / "cache").iterdir())
+    with rasterio.open(f"{base_url}/landcover.tif", opener=opener) as src:
+        assert (src.read(1, window=window) == expected).all()
+
+
+def test_open_landcover_remote(range_server, landcover_array, monkeypatch, tmp_path):
+    root, base_url = range_server
+    write_cog(root / "landcover.tif", landcover_array)
+    monkeypatch.setattr("processing.utils.cog_utils.CACHE_DIR", str(tmp_path / "cache"))
+
+    with open_landcover(f"{base_url}/landcover.tif") as src:
+        assert (src.read(1) == landcover_array).all()
+
+
+def test_cached_range_opener_missing_files(range_server, tmp_path):
+    _, base_url = range_server
+    opener = CachedRangeOpener(cache_dir=str(tmp_path / "cache"))
+    with pytest.raises(FileNotFoundError):
+        opener(f"{base_url}/missing.tif")
+    with pytest.raises(FileNotFoundError):
+        opener("test")
+
+
+def _landcover_stats(tmp_path, name, tiff_path):
+    con = duckdb.connect(str(tmp_path / f"{name}.duckdb"))
+    con.execute("CREATE TABLE canada_bboxes (id INTEGER, bbox DOUBLE[])")
+    con.execute("""
+        INSERT INTO canada_bboxes VALUES
+            (1, [-74.9, 45.1, -74.8, 45.2]),
+            (2, [-74.5, 45.5, -74.3, 45.6]),
+            (3, [-74.05, 45.9, -73.9, 46.05])
+    """)
+    create_landcover_table(con)
+    asyncio.run(update_landcover_from_tiff(con, str(tiff_path)))
+    return con.execute("SELECT * FROM landcover_stats ORDER BY id").fetchall()
+
+
+def test_landcover_stats_from_remote_cog_match_local(range_server, landcover_array, monkeypatch, tmp_path):
+    root, base_url = range_server
+    local = write_cog(
+        root / "landcover.tif", landcover_array, crs="EPSG:4326",
+        transform=from_origin(-75.0, 46.0, 1 / 1024, 1 / 1024),
+    )
+    monkeypatch.setattr("processing.utils.cog_utils.CACHE_DIR", str(tmp_path / "cache"))
+
+    expected = _landcover_stats(tmp_path, "local", local)
+    assert [row[2] > 0 for row in expected] == [True, True, True]
+    assert _landcover_stats(tmp_path, "remote", f"{base_url}/landcover.tif") == expected
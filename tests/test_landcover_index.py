@@ -0,0 +1,33 @@
+import numpy as np
+from rasterio.transform import from_origin
+
+from processing.utils.landcover_index import LandcoverIndex, build_landcover_index
+from processing.utils.landcover_utils import bbox_windows
+from processing.writers.landcover_writer import _histograms, _stats_batch
+from tests.helpers import write_cog
+
+BBOXES = np.array([
+    [-74.9013, 45.1007, -74.7991, 45.2003],   # edges off the block grid
+    [-74.5, 45.5, -74.25, 45.75],             # block-aligned
+    [-74.3001, 45.3001, -74.2952, 45.3049],   # smaller than one block
+    [-75.05, 45.95, -74.95, 46.05],           # straddles the raster corner
+    [-80.0, 40.0, -79.9, 40.1],               # off the raster
+])
+
+
+def test_index_query_matches_exact_stats(landcover_array, tmp_path):
+    transform = from_origin(-75.0, 46.0, 1 / 1024, 1 / 1024)
+    tiff_path = write_cog(tmp_path / "landcover.tif", landcover_array, crs="EPSG:4326", transform=transform)
+    build_landcover_index(str(tiff_path), str(tmp_path / "index"), block_size=16)
+    result = LandcoverIndex(str(tmp_path / "index")).query(BBOXES)
+
+    windows, overlap = bbox_windows(BBOXES, "EPSG:4326", transform, *landcover_array.shape[::-1])
+    crops = [landcover_array[r:r + h, c:c + w] for r, c, h, w in windows]
+    exact = _stats_batch(np.arange(len(BBOXES)), _histograms(crops)).to_pydict()
+
+    assert overlap.tolist() == [True, True, True, True, False]
+    assert result["nodata"][overlap].tolist() == np.asarray(exact["nodata"])[overlap].tolist()
+    for k in range(result["counts"].shape[1]):
+        assert result["counts"][:, k].tolist() == exact[f"class_{k + 1}"]
+    assert result["total_count"].tolist() == np.where(overlap, exact["total_count"], -1).tolist()
+    assert np.allclose(result["entropy"], exact["entropy"])
@@ -0,0 +1,134 @@
+import asyncio
+
+import duckdb
+import numpy as np
+import pytest
+from rasterio.transform import from_origin
+
+from processing.writers.landcover_writer import (
+    NUM_CLASSES, create_landcover_table, refine_landcover_stats, update_landcover_epochs,
+    update_landcover_from_tiff,
+)
+from tests.helpers import write_cog
+
+PIXEL_DEG = 1 / 1024
+CLASS_COLUMNS = [f"class_{i}" for i in range(1, NUM_CLASSES + 1)]
+
+
+def _pixel_bbox(row0, col0, row1, col1):
+    """lon/lat bbox whose pixel window on the test grid is [row0, row1) x [col0, col1)."""
+    inset = 0.25
+    return [
+        -75.0 + (col0 + inset) * PIXEL_DEG, 46.0 - (row1 - inset) * PIXEL_DEG,
+        -75.0 + (col1 - inset) * PIXEL_DEG, 46.0 - (row0 + inset) * PIXEL_DEG,
+    ]
+
+
+def _bbox_db(path, bboxes):
+    con = duckdb.connect(str(path))
+    con.execute("CREATE TABLE canada_bboxes (id INTEGER, bbox DOUBLE[])")
+    con.executemany("INSERT INTO canada_bboxes VALUES (?, ?)", list(enumerate(bboxes)))
+    create_landcover_table(con)
+    return con
+
+
+def _stats(con):
+    return con.execute(f"""
+        SELECT id, nodata, total_count, {", ".join(CLASS_COLUMNS)}, decimation, approx_error
+        FROM landcover_stats ORDER BY id
+    """).fetchall()
+
+
+@pytest.fixture
+def landcover_tiff(landcover_array, tmp_path):
+    return str(write_cog(
+        tmp_path / "landcover.tif", landcover_array, crs="EPSG:4326",
+        transform=from_origin(-75.0, 46.0, PIXEL_DEG, PIXEL_DEG),
+    ))
+
+
+BBOXES = [_pixel_bbox(100, 100, 400, 420), _pixel_bbox(500, 37, 700, 301), _pixel_bbox(0, 0, 1024, 1024)]
+
+
+def test_approximate_stats_within_estimate_and_refined_to_exact(landcover_tiff, tmp_path):
+    exact_con = _bbox_db(tmp_path / "exact.duckdb", BBOXES)
+    asyncio.run(update_landcover_from_tiff(exact_con, landcover_tiff))
+    exact = _stats(exact_con)
+
+    con = _bbox_db(tmp_path / "approx.duckdb", BBOXES)
+    asyncio.run(update_landcover_from_tiff(con, landcover_tiff, approximate=True))
+    approx = _stats(con)
+
+    for exact_row, approx_row in zip(exact, approx):
+        decimation, approx_error = approx_row[-2:]
+        assert decimation == 2 and approx_error > 0
+        exact_frac = np.array(exact_row[3:3 + NUM_CLASSES]) / exact_row[2]
+        approx_frac = np.array(approx_row[3:3 + NUM_CLASSES]) / approx_row[2]
+        assert np.abs(approx_frac - exact_frac).max() <= approx_error
+
+    asyncio.run(refine_landcover_stats(con, landcover_tiff_path=landcover_tiff))
+    assert _stats(con) == exact
+    assert {row[-2:] for row in exact} == {(1, 0.0)}
+
+
+def _centre_bbox(row, col, size):
+    """lon/lat bbox whose corners are the centres of a size x size pixel block at (row, col)."""
+    return [
+        -75.0 + (col + 0.5) * PIXEL_DEG, 46.0 - (row + size - 0.5) * PIXEL_DEG,
+        -75.0 + (col + size - 0.5) * PIXEL_DEG, 46.0 - (row + 0.5) * PIXEL_DEG,
+    ]
+
+
+def test_label_patches_line_up_with_bbox_window(landcover_array, landcover_tiff, tmp_path):
+    corners = [(10, 20), (300, 517), (1000, 1000)]
+    con = _bbox_db(tmp_path / "labels.duckdb", [_centre_bbox(r, c, 16) for r, c in corners])
+    store_path = str(tmp_path / "labels.npy")
+
+    asyncio.run(update_landcover_from_tiff(con, landcover_tiff, label_store_path=store_path, label_size=16))
+
+    store = np.load(store_path)
+    for i, (r, c) in enumerate(corners):
+        expected = np.zeros((16, 16), dtype=np.uint8)
+        window = landcover_array[r:r + 16, c:c + 16]
+        expected[:window.shape[0], :window.shape[1]] = window
+        assert (store[i] == expected).all()
+
+
+def test_approximate_mode_rejects_label_store(landcover_tiff, tmp_path):
+    con = _bbox_db(tmp_path / "labels.duckdb", BBOXES)
+    with pytest.raises(ValueError, match="exact reads"):
+        asyncio.run(update_landcover_from_tiff(
+            con, landcover_tiff, approximate=True, label_store_path=str(tmp_path / "labels.npy")
+        ))
+    assert not (tmp_path / "labels.npy").exists()
+
+
+def test_epoch_transitions_match_hand_built_rasters(tmp_path):
+    # 2010: class 1 above row 16, class 5 below; 2015: class 1 left of col 12, class 5 right
+    rows, cols = np.mgrid[0:32, 0:32]
+    before = np.where(rows < 16, 1, 5).astype(np.uint8)
+    after = np.where(cols < 12, 1, 5).astype(np.uint8)
+    transform = from_origin(-75.0, 46.0, PIXEL_DEG, PIXEL_DEG)
+    epoch_tiffs = {
+        "2010": str(write_cog(tmp_path / "lc2010.tif", before, crs="EPSG:4326", transform=transform)),
+        "2015": str(write_cog(tmp_path / "lc2015.tif", after, crs="EPSG:4326", transform=transform)),
+    }
+    # pixel window rows 8-23, cols 8-23, and one bbox off the raster
+    con = _bbox_db(tmp_path / "epochs.duckdb", [_pixel_bbox(8, 8, 24, 24), [-80.0, 40.0, -79.9, 40.1]])
+
+    asyncio.run(update_landcover_epochs(con, epoch_tiffs, vrt_path=str(tmp_path / "epochs.vrt")))
+
+    assert con.execute("""
+        SELECT from_epoch, to_epoch, from_class, to_class, count
+        FROM landcover_transitions WHERE id = 0 ORDER BY from_class, to_class
+    """).fetchall() == [
+        ("2010", "2015", 1, 1, 8 * 4), ("2010", "2015", 1, 5, 8 * 12),
+        ("2010", "2015", 5, 1, 8 * 4), ("2010", "2015", 5, 5, 8 * 12),
+    ]
+    assert con.execute("""
+        SELECT id, epoch, total_count, class_1, class_5 FROM landcover_epoch_stats ORDER BY id, epoch
+    """).fetchall() == [
+        (0, "2010", 256, 128, 128), (0, "2015", 256, 64, 192),
+        (1, "2010", -1, 0, 0), (1, "2015", -1, 0, 0),
+    ]
+    assert con.execute("SELECT COUNT(*) FROM landcover_transitions WHERE id = 1").fetchone()[0] == 0
@@ -0,0 +1,38 @@
+import geopandas as gpd
+import shapely
+
+from processing.utils.layer_utils import BOUNDS_COLUMNS, ingest_layer, layer_cache_path, read_layer
+
+
+def _write_layer(tmp_path):
+    layer = tmp_path / "layer"
+    layer.mkdir()
+    gpd.GeoDataFrame(
+        {"GID": ["1", "2"]},
+        geometry=[shapely.box(-75.0, 45.0, -74.0, 46.0), shapely.box(-80.0, 50.0, -78.0, 52.0)],
+        crs="EPSG:4326",
+    ).to_file(layer / "layer.shp")
+    return str(layer)
+
+
+def test_read_layer_uses_cache_with_bounds(tmp_path):
+    shapefile = _write_layer(tmp_path)
+    ingest_layer(shapefile, columns=["GID"], cache_dir=str(tmp_path / "cache"))
+
+    gdf = read_layer(shapefile, cache_dir=str(tmp_path / "cache"))
+    assert gdf.crs.to_epsg() == 4326
+    assert list(gdf.columns) == ["GID", "geometry", *BOUNDS_COLUMNS]
+    assert gdf["minx"].tolist() == [-75.0, -80.0]
+
+
+def test_read_layer_cache_without_crs_falls_back_to_layer_crs(tmp_path):
+    shapefile = _write_layer(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    path = ingest_layer(shapefile, columns=["GID"], cache_dir=cache_dir)[0]
+    # rewrite the cache without CRS metadata
+    gpd.read_parquet(path).set_crs(None, allow_override=True).to_parquet(path, index=False)
+    assert gpd.read_parquet(layer_cache_path(shapefile, cache_dir=cache_dir)).crs is None
+
+    gdf = read_layer(shapefile, columns=["GID"], cache_dir=cache_dir)
+    assert gdf.crs.to_epsg() == 4326
+    assert gdf["GID"].tolist() == ["1", "2"]
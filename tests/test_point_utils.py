@@ -0,0 +1,85 @@
+import asyncio
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from processing.utils import point_utils
+
+
+def test_random_points_worker_samples_on_mask(monkeypatch):
+    mask = shapely.box(-80.0, 45.0, -70.0, 50.0)
+    shapely.prepare(mask)
+    monkeypatch.setattr(point_utils, "LAND_MASK", mask, raising=False)
+
+    lons, lats = point_utils._random_points_worker(500, np.random.SeedSequence(0))
+
+    assert len(lons) == len(lats) == 500
+    assert shapely.contains_xy(mask, lons, lats).all()
+
+
+def test_random_points_worker_raises_when_mask_misses_bbox(monkeypatch):
+    # southern hemisphere: never inside CANADA_BBOX
+    mask = shapely.box(10.0, -40.0, 20.0, -30.0)
+    shapely.prepare(mask)
+    monkeypatch.setattr(point_utils, "LAND_MASK", mask, raising=False)
+    monkeypatch.setattr(point_utils, "MAX_SAMPLE_ATTEMPTS", 50)
+
+    with pytest.raises(ValueError, match="Land mask accepted only 0 of 10 points"):
+        point_utils._random_points_worker(10, np.random.SeedSequence(0))
+
+
+def test_random_points_worker_zero_points(monkeypatch):
+    monkeypatch.setattr(point_utils, "LAND_MASK", None, raising=False)
+    lons, lats = point_utils._random_points_worker(0, np.random.SeedSequence(0))
+    assert len(lons) == len(lats) == 0
+
+
+@pytest.fixture
+def polygon_layer(tmp_path, monkeypatch):
+    monkeypatch.setattr(point_utils, "TRIANGLE_CACHE_DIR", str(tmp_path / "triangles"))
+    layer = tmp_path / "layer"
+    layer.mkdir()
+    gpd.GeoDataFrame(
+        {"GID": ["1", "2"]},
+        geometry=[shapely.box(-75.0, 45.0, -74.0, 46.0), shapely.box(-80.0, 50.0, -78.0, 52.0)],
+        crs="EPSG:4326",
+    ).to_file(layer / "layer.shp")
+    return str(layer)
+
+
+def _points_by_id(points):
+    by_id = {}
+    for p in points:
+        by_id.setdefault(p["GID"], []).append((p["lon"], p["lat"]))
+    return by_id
+
+
+def test_triangulation_falls_back_per_geometry(polygon_layer, monkeypatch):
+    triangulate = shapely.constrained_delaunay_triangles
+
+    def failing_for_large(geom):
+        if geom.area > 1.5:
+            raise shapely.errors.GEOSException("synthetic failure")
+        return triangulate(geom)
+
+    monkeypatch.setattr(shapely, "constrained_delaunay_triangles", failing_for_large)
+    points = asyncio.run(point_utils.sample_points_per_geometry(
+        polygon_layer, "GID", n_points_per_geom=20, seed=0, method="triangulation"
+    ))
+
+    by_id = _points_by_id(points)
+    assert sorted(by_id) == ["1", "2"]
+    assert len(by_id["1"]) == len(by_id["2"]) == 20
+    lons, lats = np.array(by_id["2"]).T
+    assert shapely.contains_xy(shapely.box(-80.0, 50.0, -78.0, 52.0), lons, lats).all()
+
+
+def test_triangulation_without_constrained_delaunay(polygon_layer, monkeypatch):
+    monkeypatch.delattr(shapely, "constrained_delaunay_triangles", raising=False)
+    points = asyncio.run(point_utils.sample_points_per_geometry(
+        polygon_layer, "GID", n_points_per_geom=5, seed=0, method="triangulation"
+    ))
+
+    assert {k: len(v) for k, v in _points_by_id(points).items()} == {"1": 5, "2": 5}
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+import pytest
+
+from processing.writers import rcm_writer
+
+
+def test_migration_keeps_old_list_shapes():
+    con = duckdb.connect()
+    # pre-bridge layout
+    con.execute("CREATE TABLE rcm_ard_items (id INTEGER PRIMARY KEY, items TEXT[])")
+    con.execute("CREATE TABLE rcm_ard_properties (item TEXT PRIMARY KEY, datetime TEXT, order_key TEXT)")
+    con.execute("INSERT INTO rcm_ard_items VALUES (1, ['A', 'B']), (2, ['B']), (3, [])")
+    con.execute("""
+        INSERT INTO rcm_ard_properties VALUES
+            ('A', '2020-01-01T00:00:00Z', 'A_CH_CV_MLC'), ('B', '2021-01-01T00:00:00Z', 'B_CH_CV_MLC')
+    """)
+
+    asyncio.run(rcm_writer.create_rcm_ard_tables(con))
+
+    assert con.execute("SELECT COUNT(*) FROM rcm_items").fetchone()[0] == 2
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_bbox_items").fetchone()[0] == 3
+    # compatibility view: bboxes without matches read back as [] like the old table
+    assert con.execute("SELECT id, items FROM rcm_ard_items ORDER BY id").fetchall() == [
+        (1, ["A", "B"]), (2, ["B"]), (3, []),
+    ]
+    assert con.execute("SELECT item FROM rcm_ard_properties ORDER BY item").fetchall() == [("A",), ("B",)]
+
+
+def _feature(item, datetime, bounds):
+    minx, miny, maxx, maxy = bounds
+    return {
+        "type": "Feature",
+        "id": item,
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]],
+        },
+        "properties": {"datetime": datetime, "order_key": f"{item}_CH_CV_MLC"},
+        "assets": {"rl": {"href": f"https://example.com/{item}_RL.tif"}},
+    }
+
+
+CATALOG = [
+    _feature("A", "2020-01-01T00:00:00Z", (-76.0, 44.0, -74.0, 46.0)),
+    _feature("B", "2021-06-01T00:00:00Z", (-75.5, 44.5, -74.5, 45.5)),
+    # partially overlaps bbox 1 only
+    _feature("C", "2022-01-01T00:00:00Z", (-75.05, 44.9, -74.95, 45.3)),
+    # before the default search window
+    _feature("D", "2018-01-01T00:00:00Z", (-76.0, 44.0, -74.0, 46.0)),
+    _feature("E", "2023-01-01T00:00:00Z", (-81.0, 49.0, -79.0, 51.0)),
+    # intersects bbox 2 without containing it
+    _feature("F", "2022-06-01T00:00:00Z", (-75.85, 45.7, -75.7, 45.85)),
+]
+PAGE_SIZE = 2
+
+
+class StacItemsHandler(BaseHTTPRequestHandler):
+    """Serves CATALOG at /collections/rcm-ard/items in PAGE_SIZE pages linked by `next`."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/search":
+            self._search(parse_qs(url.query))
+            return
+        if url.path != "/collections/rcm-ard/items":
+            self.send_error(404)
+            return
+        page = int(parse_qs(url.query).get("page", ["0"])[0])
+        body = {
+            "type": "FeatureCollection",
+            "features": CATALOG[page * PAGE_SIZE:(page + 1) * PAGE_SIZE],
+            "links": [],
+        }
+        if (page + 1) * PAGE_SIZE < len(CATALOG):
+            host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            body["links"].append({"rel": "next", "href": f"{host}{url.path}?page={page + 1}"})
+        self._send(body)
+
+    def _search(self, query):
+        """Features whose bounds intersect `bbox` within the `datetime` interval, on one page."""
+        minx, miny, maxx, maxy = map(float, query["bbox"][0].split(","))
+        start, end = query["datetime"][0].split("/")
+        features = []
+        for f in CATALOG:
+            ring = f["geometry"]["coordinates"][0]
+            xs, ys = [p[0] for p in ring], [p[1] for p in ring]
+            if (min(xs) <= maxx and max(xs) >= minx and min(ys) <= maxy and max(ys) >= miny
+                    and start <= f["properties"]["datetime"] <= end):
+                features.append(f)
+        self._send({"type": "FeatureCollection", "features": features, "links": []})
+
+    def _send(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/geo+json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stac_items_url(monkeypatch, tmp_path):
+    monkeypatch.setattr(rcm_writer, "CATALOG_GEOPARQUET", str(tmp_path / "catalog.parquet"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StacItemsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/collections/rcm-ard/items"
+    server.shutdown()
+    server.server_close()
+
+
+def _bbox_db():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE canada_bboxes (id INTEGER, bbox DOUBLE[])")
+    con.execute("CREATE TABLE landcover_stats (id INTEGER, total_count BIGINT)")
+    con.execute("""
+        INSERT INTO canada_bboxes VALUES
+            (1, [-75.02, 45.0, -74.98, 45.04]),
+            (2, [-75.9, 45.8, -75.8, 45.9]),
+            (3, [-60.0, 60.0, -59.9, 60.1])
+    """)
+    con.execute("INSERT INTO landcover_stats VALUES (1, 10), (2, 10), (3, 10)")
+    asyncio.run(rcm_writer.create_rcm_ard_tables(con))
+    return con
+
+
+@pytest.fixture
+def bbox_db():
+    return _bbox_db()
+
+
+def _matches(con):
+    return con.execute("SELECT id, items FROM rcm_ard_items ORDER BY id").fetchall()
+
+
+def test_catalog_mode_harvests_from_items_url(bbox_db, stac_items_url, tmp_path):
+    con = bbox_db
+    asyncio.run(rcm_writer.update_rcm_ard_tables(con, use_catalog=True, items_url=stac_items_url))
+
+    assert con.execute(f"SELECT COUNT(*) FROM {rcm_writer.CATALOG_TABLE}").fetchone()[0] == len(CATALOG)
+    # D is outside the search window; bbox 3 is queried but has no items
+    assert _matches(con) == [(1, ["A", "B", "C"]), (2, ["A"]), (3, [])]
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_properties WHERE item = 'D'").fetchone()[0] == 0
+    assert (tmp_path / "catalog.parquet").exists()
+
+
+def test_catalog_mode_respects_search_window(bbox_db, stac_items_url, monkeypatch):
+    con = bbox_db
+    monkeypatch.setattr(rcm_writer, "SEARCH_START", "2021-01-01T00:00:00Z")
+    monkeypatch.setattr(rcm_writer, "SEARCH_END", "2021-12-31T23:59:59Z")
+    asyncio.run(rcm_writer.update_rcm_ard_tables(con, use_catalog=True, items_url=stac_items_url))
+
+    assert _matches(con) == [(1, ["B"]), (2, []), (3, [])]
+
+
+class _FailingQueueInsert:
+    """Connection wrapper that fails the first insert into the crop queue."""
+
+    def __init__(self, con):
+        self._con = con
+        self.failed = False
+
+    def execute(self, sql, *args):
+        if "INSERT INTO rcm_ard_crop_queue" in sql and not self.failed:
+            self.failed = True
+            raise duckdb.IOException("injected failure")
+        return self._con.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+
+def test_append_results_rerun_queues_pair_after_failure(bbox_db):
+    con = bbox_db
+    results = [{
+        "id": 1,
+        "rcm_items": ["A"],
+        "properties": [rcm_writer._feature_properties(CATALOG[0])],
+        "error": None,
+    }]
+
+    with pytest.raises(duckdb.IOException):
+        rcm_writer._append_results(_FailingQueueInsert(con), results)
+    # the batch rolled back as a whole
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_bbox_items").fetchone()[0] == 0
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_queried").fetchone()[0] == 0
+
+    assert rcm_writer._append_results(con, results) == (1, 0, 1)
+    assert con.execute("""
+        SELECT q.id, k.item FROM rcm_ard_crop_queue AS q JOIN rcm_items AS k USING (item_key)
+    """).fetchall() == [(1, "A")]
+
+
+@pytest.fixture
+def stac_search_url(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StacItemsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/search"
+    monkeypatch.setattr(rcm_writer, "STAC_SEARCH_URL", url)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("require_containment", [True, False])
+def test_search_modes_store_same_bridge(stac_search_url, monkeypatch, require_containment):
+    monkeypatch.setattr(rcm_writer, "REQUIRE_CONTAINMENT", require_containment)
+    matches = {}
+    for coalesce in (False, True):
+        con = _bbox_db()
+        asyncio.run(rcm_writer.update_rcm_ard_tables(con, coalesce=coalesce))
+        matches[coalesce] = _matches(con)
+
+    assert matches[False] == matches[True]
+    # F only intersects bbox 2
+    expected_2 = ["A"] if require_containment else ["A", "F"]
+    assert matches[False] == [(1, ["A", "B", "C"]), (2, expected_2), (3, [])]
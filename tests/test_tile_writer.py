@@ -0,0 +1,156 @@
+import asyncio
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pytest
+import rasterio
+from pyproj import Transformer
+from rasterio.transform import from_origin
+
+from processing.writers import tile_writer
+from processing.writers.rcm_writer import create_rcm_ard_tables
+from tests.helpers import write_cog
+
+
+@pytest.fixture
+def tiles_db():
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE canada_bboxes (id INTEGER, lon DOUBLE, lat DOUBLE, province_id INTEGER, census_div_id INTEGER)
+    """)
+    # bboxes 1-2 in the filtered census division, 3 outside it
+    con.execute("""
+        INSERT INTO canada_bboxes VALUES
+            (1, -75.0, 45.0, 10, 1006), (2, -75.1, 45.1, 10, 1006), (3, -80.0, 50.0, 35, 3501)
+    """)
+    asyncio.run(create_rcm_ard_tables(con))
+    asyncio.run(tile_writer.create_rcm_ard_tiles_table(con))
+    con.execute("""
+        INSERT INTO rcm_items (item, datetime, order_key) VALUES
+            ('A', '2024-01-01T00:00:00Z', 'A_CH_CV_MLC'),
+            ('B', '2024-01-02T00:00:00Z', 'B_CH_CV_MLC'),
+            ('C', NULL, NULL)
+    """)
+    return con
+
+
+def _queue(con, pairs):
+    for row_id, item in pairs:
+        con.execute("""
+            INSERT INTO rcm_ard_crop_queue SELECT ?, item_key FROM rcm_items WHERE item = ?
+        """, [row_id, item])
+
+
+def _queued(con):
+    return sorted(con.execute("""
+        SELECT q.id, i.item FROM rcm_ard_crop_queue q JOIN rcm_items i USING (item_key)
+    """).fetchall())
+
+
+def test_queued_crops_keep_unprocessed_pairs(tiles_db, monkeypatch):
+    con = tiles_db
+    _queue(con, [(1, "A"), (1, "B"), (2, "B"), (2, "C"), (3, "A")])
+    monkeypatch.setattr(tile_writer, "FILTER_CDUID", 1006)
+    monkeypatch.setattr(tile_writer, "ITEMS_PER_ID", None)
+
+    cropped = []
+
+    async def fake_crop_items_ranged(con, item_rows):
+        failed = []
+        for item, datetime, order_key, ids, lons, lats in item_rows:
+            if datetime is None:
+                continue
+            if item == "B":
+                failed.append(item)
+                continue
+            cropped.extend((row_id, item) for row_id in ids)
+            tile_writer.insert_tile_records(
+                con, item, [(row_id, [0.0, 0.0], f"{item}_{row_id}.tif", 256, 256) for row_id in ids]
+            )
+        return failed
+
+    monkeypatch.setattr(tile_writer, "crop_items_ranged", fake_crop_items_ranged)
+    asyncio.run(tile_writer.download_rcm_tiles(con, queued_only=True))
+
+    assert cropped == [(1, "A")]
+    # failed item B, propertyless item C and out-of-filter bbox 3 stay queued
+    assert _queued(con) == [(1, "B"), (2, "B"), (2, "C"), (3, "A")]
+
+
+def test_queued_crops_drop_pairs_passed_over_by_the_sample(tiles_db, monkeypatch):
+    con = tiles_db
+    _queue(con, [(1, "A"), (1, "B")])
+    monkeypatch.setattr(tile_writer, "FILTER_CDUID", 1006)
+    monkeypatch.setattr(tile_writer, "ITEMS_PER_ID", 1)
+
+    async def fake_crop_items_ranged(con, item_rows):
+        for item, _, _, ids, _, _ in item_rows:
+            tile_writer.insert_tile_records(
+                con, item, [(row_id, [0.0, 0.0], None, 256, 256) for row_id in ids]
+            )
+        return []
+
+    monkeypatch.setattr(tile_writer, "crop_items_ranged", fake_crop_items_ranged)
+    asyncio.run(tile_writer.download_rcm_tiles(con, queued_only=True))
+
+    assert _queued(con) == []
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_tiles").fetchone()[0] == 1
+
+
+def _write_scene(root, item, datetime, order_key, lon, lat, seed):
+    """Two synthetic band COGs laid out like the rcm-ceos-ard bucket; returns band arrays and (row, col) of lon/lat."""
+    x, y = Transformer.from_crs("EPSG:4326", "EPSG:3979", always_xy=True).transform(lon, lat)
+    res = 20.0
+    transform = from_origin(x - 300 * res, y + 400 * res, res, res)
+    col, row = ~transform * (x, y)
+    rc = (int(np.floor(row)), int(np.floor(col)))
+
+    rng = np.random.default_rng(seed)
+    urls = tile_writer.band_urls(datetime, order_key, base_url=str(root))
+    bands = {}
+    for key, path in urls.items():
+        bands[key] = rng.uniform(1, 1000, (1024, 1024)).astype(np.float32)
+        write_cog(Path(path), bands[key], crs="EPSG:3979", transform=transform, nodata=0)
+    return bands, rc
+
+
+@pytest.mark.parametrize("use_block_cache", [False, True])
+def test_range_crops_from_local_cog_server(tiles_db, range_server, monkeypatch, tmp_path, use_block_cache):
+    con = tiles_db
+    root, base_url = range_server
+    monkeypatch.setattr(tile_writer, "COG_BASE_URL", base_url)
+    monkeypatch.setattr(tile_writer, "OUTPUT_DIR", tmp_path / "tiles")
+    monkeypatch.setattr(tile_writer, "USE_BLOCK_CACHE", use_block_cache)
+    monkeypatch.setattr(tile_writer, "FILTER_CDUID", None)
+    monkeypatch.setattr(tile_writer, "ITEMS_PER_ID", None)
+    monkeypatch.setattr("processing.utils.cog_utils.CACHE_DIR", str(tmp_path / "cache"))
+
+    bands, (row, col) = _write_scene(root, "A", "2024-01-01T00:00:00Z", "A_CH_CV_MLC", -75.0, 45.0, seed=1)
+    # item B has properties but no scene on the server, so its reads fail
+    con.execute("""
+        INSERT INTO rcm_ard_queried VALUES (1, now());
+        INSERT INTO rcm_ard_bbox_items
+        SELECT 1, item_key FROM rcm_items WHERE item IN ('A', 'B');
+    """)
+
+    asyncio.run(tile_writer.download_rcm_tiles(con, mode="range"))
+
+    rows = con.execute("SELECT id, item, filepath, height, width FROM rcm_ard_tiles").fetchall()
+    assert [r[:2] for r in rows] == [(1, "A")]
+    with rasterio.open(rows[0][2]) as crop:
+        assert (crop.height, crop.width, crop.count) == (256, 256, 2)
+        assert crop.descriptions == ("rl", "rr")
+        for i, key in enumerate(["rl", "rr"], start=1):
+            expected = bands[key][row - 128:row + 128, col - 128:col + 128]
+            assert np.array_equal(crop.read(i), expected)
+
+    # rerun is idempotent: nothing new to crop, B still retried
+    asyncio.run(tile_writer.download_rcm_tiles(con, mode="range"))
+    assert con.execute("SELECT COUNT(*) FROM rcm_ard_tiles").fetchone()[0] == 1
+
+
+def test_band_urls_follow_cog_base_url(monkeypatch):
+    monkeypatch.setattr(tile_writer, "COG_BASE_URL", "http://localhost:9999/MLC")
+    urls = tile_writer.band_urls("2024-03-05T10:00:00Z", "X_CH_CV_MLC")
+    assert urls["rl"] == "http://localhost:9999/MLC/2024/03/05/X_CH_CV_MLC/X_RL.tif"